@@ -1,5 +1,11 @@
 import os
+import time
 from celery import Celery
+from celery.signals import (
+    before_task_publish, celeryd_init, worker_init, worker_process_init, worker_process_shutdown, task_prerun,
+    task_postrun,
+)
+from celery.worker.control import inspect_command
 import firebase_admin
 from firebase_admin import credentials
 from django.conf import settings
@@ -39,6 +45,119 @@ def initialize_firebase_for_celery():
 initialize_firebase_for_celery()
 
 
+def worker_profile():
+    """The WORKER_PROFILES entry this worker was started with, or None."""
+    if not settings.WORKER_PROFILE:
+        return None
+    try:
+        return settings.WORKER_PROFILES[settings.WORKER_PROFILE]
+    except KeyError:
+        raise ValueError(f"Unknown WORKER_PROFILE '{settings.WORKER_PROFILE}'. "
+                         f"Choose one of: {', '.join(settings.WORKER_PROFILES)}") from None
+
+
+def loads_models():
+    """Whether this worker runs model-heavy tasks and so should load the AI models."""
+    profile = worker_profile()
+    return profile is None or profile['load_models']
+
+
+@celeryd_init.connect
+def apply_worker_profile(sender=None, instance=None, conf=None, **kwargs):
+    """
+    Applies the WORKER_PROFILE's queues, concurrency, prefetch multiplier and
+    acks_late before the worker starts. Command line options (-Q, -c) still win.
+    """
+    profile = worker_profile()
+    if profile is None:
+        # A plain worker serves every routed queue, not only the default one.
+        queues = {conf.task_default_queue} | {route['queue'] for route in settings.CELERY_TASK_ROUTES.values()}
+        instance.app.amqp.queues.select(sorted(queues))
+        return
+    conf.worker_concurrency = profile['concurrency']
+    conf.worker_prefetch_multiplier = profile['prefetch_multiplier']
+    conf.task_acks_late = profile['acks_late']
+    # Same as `-Q <queues>`: consume only the profile's queues.
+    instance.app.amqp.queues.select(profile['queues'])
+    print(f"Celery Worker {sender}: '{settings.WORKER_PROFILE}' profile, queues {profile['queues']}, "
+          f"concurrency {profile['concurrency']}, prefetch x{profile['prefetch_multiplier']}, "
+          f"acks_late={profile['acks_late']}.")
+
+
+@worker_init.connect
+def preload_models(**kwargs):
+    """
+    Loads the AI models in the worker's parent process, before the prefork pool
+    starts, so all children share one copy of the weights (copy-on-write).
+    """
+    if not settings.PRELOAD_AI_MODELS or not loads_models():
+        return
+    from recommendations.ai_services.model_registry import preload_models as load_shared_models
+    print(f"Celery Worker {os.getpid()}: Preloading AI models before fork...")
+    if load_shared_models():
+        print(f"Celery Worker {os.getpid()}: AI models preloaded and frozen.")
+
+
+@worker_init.connect
+def configure_recycling(sender=None, **kwargs):
+    """Sets the per-child memory limit once the parent holds the preloaded models."""
+    from .worker_recycling import configure_memory_limit
+    configure_memory_limit(sender)
+
+
+@worker_process_init.connect
+def warm_up_models(**kwargs):
+    """
+    Loads the AI models in each worker process before it accepts tasks, so the
+    first segmentation does not pay for the model load. Web processes never
+    run this, so they never import torch. Models preloaded by the parent are
+    simply reused here.
+    """
+    from recommendations.ai_services.model_registry import configure_child_process, warm_up_models as load_models
+    from .worker_recycling import on_child_ready
+    started = time.monotonic()
+    configure_child_process()
+    if settings.WARM_UP_AI_MODELS and loads_models():
+        print(f"Celery Worker {os.getpid()}: Warming up AI models...")
+        load_models()
+        print(f"Celery Worker {os.getpid()}: AI models ready.")
+    on_child_ready(started)
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    from .lanes import stamp
+    stamp(headers)
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    from .lanes import record_queue_wait as record
+    record(task.request)
+
+
+@task_postrun.connect
+def track_child_memory(**kwargs):
+    from .worker_recycling import on_task_finished
+    on_task_finished()
+
+
+@worker_process_shutdown.connect
+def record_child_exit(exitcode=None, **kwargs):
+    from .worker_recycling import on_child_exit
+    on_child_exit(exitcode)
+
+
+@inspect_command()
+def model_memory(state, **kwargs):
+    """
+    Per-process RSS versus shared memory of this worker and its pool children:
+    `celery -A fashionRecommendationSystem inspect model_memory`
+    """
+    from recommendations.ai_services.model_registry import memory_report
+    return memory_report()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -0,0 +1,75 @@
+"""
+Conditional GET (ETag / Last-Modified) for read-mostly viewsets.
+
+The validators come from version stamps, never from the rendered body, so a
+request that matches them is answered 304 after one small aggregate query,
+without fetching rows or serializing anything:
+
+* list: MAX(updated_at) and COUNT(*) of the filtered queryset (deletions lower
+  the count), plus MAX(updated_at) of every model in `conditional_dependencies`
+  whose rows are nested into the response;
+* retrieve: the object's updated_at plus the same dependency stamps.
+
+The ETag also covers the full path with its query string, so every page,
+filter and search has its own. Non-matching requests get the normal
+(enveloped) response with ETag and Last-Modified headers set.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    last_modified_field = 'updated_at'
+    # Models whose rows are nested into this viewset's responses.
+    conditional_dependencies = ()
+
+    def list(self, request, *args, **kwargs):
+        stamps = self.version_queryset().aggregate(
+            last_modified=Max(self.last_modified_field), count=Count('pk')
+        )
+        return self.conditional_response(
+            request, stamps['last_modified'], stamps['count'], lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        last_modified = self.version_queryset().filter(
+            **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        ).values_list(self.last_modified_field, flat=True).first()
+        if last_modified is None:
+            # Unknown object: let the regular path produce the 404.
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request, last_modified, None, lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+    def version_queryset(self):
+        """The filtered queryset without ordering or prefetches, for the stamp queries."""
+        return self.filter_queryset(self.get_queryset()).order_by().prefetch_related(None)
+
+    def conditional_response(self, request, last_modified, count, build_response):
+        for model in self.conditional_dependencies:
+            dependency = model.objects.aggregate(last_modified=Max('updated_at'))['last_modified']
+            if dependency is not None and (last_modified is None or dependency > last_modified):
+                last_modified = dependency
+
+        version = f"{request.get_full_path()}|{last_modified.isoformat() if last_modified else ''}|{count}"
+        etag = quote_etag(hashlib.md5(version.encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            return not_modified
+
+        response = build_response()
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
@@ -0,0 +1,40 @@
+"""
+Priority lanes for the model-heavy tasks.
+
+Style uploads (a user is waiting) run in the `interactive` lane, catalog
+backfills in the `batch` lane. Both go to the same `inference` queue; the Redis
+broker keeps one list per priority (CELERY_BROKER_TRANSPORT_OPTIONS) and the
+inference workers, which reserve a single task at a time, always take the
+interactive list first. Catalog work is split into small tasks, so a new upload
+waits at most for the batch task that is already running, while the batch lane
+uses whatever capacity uploads leave idle.
+
+Every task is stamped with the time it was published, and the time it spent in
+the queue is recorded as the `queue_wait.<lane>` metric.
+"""
+import time
+
+from . import metrics
+
+# Redis: 0 is the highest priority, 9 the lowest.
+INTERACTIVE = 0
+BATCH = 9
+
+
+def lane(priority):
+    """The lane name of a message priority."""
+    return 'batch' if priority is not None and priority >= BATCH else 'interactive'
+
+
+def stamp(headers):
+    """Marks an outgoing message with its publish time."""
+    headers.setdefault('enqueued_at', time.time())
+
+
+def record_queue_wait(request):
+    """Records how long the task of `request` waited in its queue."""
+    enqueued_at = getattr(request, 'enqueued_at', None)
+    if enqueued_at is None:
+        return
+    priority = (request.delivery_info or {}).get('priority')
+    metrics.observe(f'queue_wait.{lane(priority)}', max(time.time() - enqueued_at, 0))
@@ -0,0 +1,39 @@
+"""
+Short-lived locks shared by the web and worker processes.
+
+A lock is a key added to the default cache (Redis) with cache.add(), which only
+succeeds for the first caller. Locks expire on their own, so a worker that dies
+while holding one blocks the work for at most `timeout` seconds.
+"""
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+KEY_PREFIX = 'lock'
+
+
+def _key(name):
+    return f'{KEY_PREFIX}:{name}'
+
+
+def acquire(name, timeout):
+    """Takes the lock `name` for `timeout` seconds. Returns False if someone else holds it."""
+    return cache.add(_key(name), 1, timeout=timeout)
+
+
+def release(name):
+    cache.delete(_key(name))
+
+
+@contextmanager
+def held(name, timeout):
+    """
+    with locks.held('segmentation:<id>', 600) as acquired:
+        if not acquired: ...  # the same work is already in flight
+    """
+    acquired = acquire(name, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release(name)
@@ -0,0 +1,75 @@
+"""
+Lightweight counters and timings shared by the web and worker processes.
+
+Values live in the default cache (Redis), so every process adds to the same
+numbers and GET /api/metrics/ (admins only) returns the whole set. Recording a
+metric never raises: losing a sample is better than failing a request or task.
+"""
+from django.core.cache import cache
+
+from . import locks
+
+KEY_PREFIX = 'metrics'
+NAMES_KEY = f'{KEY_PREFIX}:names'
+
+# Names this process already registered, to skip the registry round trip.
+_registered = set()
+
+
+def _key(name):
+    return f'{KEY_PREFIX}:{name}'
+
+
+def _register(name):
+    if name in _registered:
+        return
+    # The registry is read, extended and written back: processes registering
+    # at the same time would drop each other's names without the lock. When it
+    # is busy the name stays unregistered here and the next call retries.
+    with locks.held(NAMES_KEY, timeout=5) as acquired:
+        if not acquired:
+            return
+        names = cache.get(NAMES_KEY) or []
+        if name not in names:
+            cache.set(NAMES_KEY, sorted(set(names) | {name}), timeout=None)
+    _registered.add(name)
+
+
+def incr(name, amount=1):
+    """Adds `amount` to the counter `name`."""
+    try:
+        cache.add(_key(name), 0, timeout=None)
+        try:
+            cache.incr(_key(name), amount)
+        except ValueError:  # evicted between add() and incr()
+            cache.set(_key(name), amount, timeout=None)
+        _register(name)
+    except Exception as e:
+        print(f"Could not record metric {name}: {e}")
+
+
+def observe(name, seconds):
+    """Records one duration: `<name>.count` and `<name>.total_ms`."""
+    incr(f'{name}.count')
+    incr(f'{name}.total_ms', int(seconds * 1000))
+
+
+def snapshot():
+    """All recorded metrics as {name: value}."""
+    names = cache.get(NAMES_KEY) or []
+    values = cache.get_many([_key(name) for name in names])
+    return {name: values.get(_key(name), 0) for name in names}
+
+
+def average(name):
+    """Mean of the durations recorded with observe(name), in seconds, or None without samples."""
+    values = cache.get_many([_key(f'{name}.count'), _key(f'{name}.total_ms')])
+    count = values.get(_key(f'{name}.count'))
+    if not count:
+        return None
+    return values.get(_key(f'{name}.total_ms'), 0) / count / 1000
+
+
+def value(name):
+    """Current value of the counter `name` (0 if never recorded)."""
+    return cache.get(_key(name)) or 0
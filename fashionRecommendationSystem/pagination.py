@@ -1,7 +1,13 @@
 # app/pagination.py
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
-from rest_framework.utils.urls import replace_query_param
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class GlobalPageNumberPagination(PageNumberPagination):
@@ -30,3 +36,134 @@ class GlobalPageNumberPagination(PageNumberPagination):
         })
         resp._success_message = "OK"
         return resp
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (created_at, pk), newest first.
+
+    Every page is one indexed range scan: no OFFSET and no COUNT(*), so page
+    1000 costs the same as page 1. The response keeps the envelope of
+    GlobalPageNumberPagination: `page`, `total_pages` and `last` are null,
+    `first` drops the cursor, and `count` is the planner's row estimate
+    (`count_is_estimate: true`), or exact with `?count=exact`.
+    Requests that send `?page=` (and no cursor) are still served by
+    GlobalPageNumberPagination, so existing clients keep their page numbers.
+    Select it per viewset with `pagination_class = KeysetPagination`.
+    """
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    ordering_field = "created_at"
+    invalid_cursor_message = "Invalid cursor."
+    page_number_class = GlobalPageNumberPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_number_pagination = None
+        if (request.query_params.get(self.page_number_class.page_query_param)
+                and not request.query_params.get(self.cursor_query_param)):
+            self.page_number_pagination = self.page_number_class()
+            if not queryset.ordered:
+                queryset = queryset.order_by(f"-{self.ordering_field}", "-pk")
+            return self.page_number_pagination.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count, self.count_is_estimate = self.get_count(queryset)
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor["direction"] == "prev"
+        field = self.ordering_field
+        if reverse:
+            queryset = queryset.order_by(field, "pk")
+        else:
+            queryset = queryset.order_by(f"-{field}", "-pk")
+
+        if cursor is not None:
+            value, pk = cursor["value"], cursor["pk"]
+            if reverse:
+                queryset = queryset.filter(Q(**{f"{field}__gt": value}) | Q(**{field: value, "pk__gt": pk}))
+            else:
+                queryset = queryset.filter(Q(**{f"{field}__lt": value}) | Q(**{field: value, "pk__lt": pk}))
+
+        # One extra row tells whether there is another page in this direction.
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_prev = cursor is not None and (has_more if reverse else True)
+        self.page = page
+        return page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_count(self, queryset):
+        """(count, is_estimate): exact on request, otherwise the planner's estimate."""
+        if self.request.query_params.get(self.count_query_param) == "exact":
+            return queryset.count(), False
+        try:
+            plan = json.loads(queryset.order_by().explain(format="json"))
+            return int(plan[0]["Plan"]["Plan Rows"]), True
+        except Exception:
+            return None, True
+
+    def encode_cursor(self, obj, direction):
+        value = getattr(obj, self.ordering_field)
+        payload = json.dumps({"v": value.isoformat(), "pk": str(obj.pk), "d": direction})
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, urlsafe_b64encode(payload.encode()).decode()
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            value = datetime.fromisoformat(payload["v"])
+            direction = payload["d"]
+            if direction not in ("next", "prev"):
+                raise ValueError(direction)
+            return {"value": value, "pk": payload["pk"], "direction": direction}
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], "next")
+
+    def get_previous_link(self):
+        if not self.has_prev or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], "prev")
+
+    def get_paginated_response(self, data):
+        if self.page_number_pagination is not None:
+            return self.page_number_pagination.get_paginated_response(data)
+
+        resp = Response({
+            "data": data,
+            "count": self.count,
+            "count_is_estimate": self.count_is_estimate,
+            "total_pages": None,
+            "page": None,
+            "page_size": self.page_size,
+            "next": self.get_next_link(),
+            "prev": self.get_previous_link(),
+            "first": remove_query_param(self.base_url, self.cursor_query_param),
+            "last": None,
+        })
+        resp._success_message = "OK"
+        return resp
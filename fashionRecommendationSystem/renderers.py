@@ -1,34 +1,66 @@
 # app/renderers.py
+import orjson
 from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
 
 
 class EnvelopeJSONRenderer(JSONRenderer):
     def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(self.envelope(data, renderer_context), accepted_media_type, renderer_context)
+
+    def envelope(self, data, renderer_context):
+        """Wraps `data` in the {success, message, data} envelope the API answers with."""
         response = renderer_context["response"]
 
         # Skip wrapping for special cases
         if getattr(response, "_skip_envelope", False) or data is None:
-            return super().render(data, accepted_media_type, renderer_context)
+            return data
 
         if response.exception:
-            payload = {
+            return {
                 "success": False,
                 "message": data.get("detail", "Request failed."),
                 "data": None
             }
         elif isinstance(data, dict) and "data" in data and any(k in data for k in ["count", "page"]):
             # Pagination response — merge directly
-            payload = {
+            return {
                 "success": True,
                 "message": getattr(response, "_success_message", None),
                 **data
             }
         else:
             # Normal response
-            payload = {
+            return {
                 "success": True,
                 "message": getattr(response, "_success_message", None),
                 "data": data
             }
 
-        return super().render(payload, accepted_media_type, renderer_context)
+
+class OrjsonEnvelopeRenderer(EnvelopeJSONRenderer):
+    """
+    EnvelopeJSONRenderer serialized with orjson instead of the stdlib encoder.
+
+    With DRF's default settings (COMPACT_JSON, UNICODE_JSON) the output is the
+    same bytes as EnvelopeJSONRenderer: datetimes, dates and times are handed to
+    DRF's encoder (millisecond precision, 'Z' for UTC), and so are Decimals,
+    lazy strings and anything else orjson does not know. The one difference is
+    the exponent form of very small or large floats (1e-05 is written 0.00001),
+    which parses to the same number. Requests asking for an indent, or a non
+    default JSON setting, fall back to the stdlib path.
+    """
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    _default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(self.envelope(data, renderer_context), default=self._default, option=self.OPTIONS)
+        # Same escaping as JSONRenderer: keep the output valid JavaScript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
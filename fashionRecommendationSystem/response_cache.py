@@ -0,0 +1,173 @@
+"""
+Server-side cache of rendered responses for anonymous catalog reads.
+
+Anonymous list/retrieve responses are the same bytes for everyone, so the
+final (enveloped, rendered) body is stored in the default cache and served
+without touching the database. A key combines:
+
+* the path, the query parameters (sorted, empty ones dropped), the API
+  version and the negotiated format;
+* generation counters: the scope's list generation (list views) or the
+  object's version (detail views), plus the scope's dependency generation,
+  bumped when a nested model changes (a category renamed inside products).
+
+Signals (products/signals.py) bump exactly the counters a change affects, so
+stale entries are never read again and simply expire. The bumps wait for the
+writer's transaction to commit: bumped earlier, a read in between would store
+the old rows under the new generation. On a miss only one
+request renders the response; concurrent requests for the same cold key wait
+briefly for it instead of all hitting the database. Hits, misses and waits
+are counted as `response_cache.{hit,miss,wait}.<scope>`.
+"""
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import locks, metrics
+
+KEY_PREFIX = 'response_cache'
+# How often and how long a request waits for another one filling the same key.
+FILL_POLL_SECONDS = 0.05
+FILL_WAIT_SECONDS = 2
+
+
+def _generation_key(scope, name):
+    return f'{KEY_PREFIX}:gen:{scope}:{name}'
+
+
+def _object_name(object_pk):
+    """
+    Canonical form of a primary key, the same for the URL kwarg and the model's
+    pk: an upper-case or unhyphenated UUID in the URL must not bypass invalidation.
+    """
+    try:
+        return f'obj:{uuid.UUID(str(object_pk))}'
+    except ValueError:
+        return f'obj:{object_pk}'
+
+
+def _generations(scope, object_pk=None):
+    names = ['deps', _object_name(object_pk) if object_pk is not None else 'list']
+    keys = [_generation_key(scope, name) for name in names]
+    values = cache.get_many(keys)
+    return [values.get(key, 0) for key in keys]
+
+
+def _bump(key):
+    try:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+    except ValueError:  # evicted between add() and incr()
+        cache.set(key, 1, timeout=None)
+    except Exception as e:
+        print(f"Could not invalidate cached responses ({key}): {e}")
+
+
+def _bump_on_commit(keys):
+    transaction.on_commit(lambda: [_bump(key) for key in keys])
+
+
+def invalidate(scope, object_pks=()):
+    """A row of `scope` changed: drops its lists and the given objects' details (on commit)."""
+    _bump_on_commit([
+        _generation_key(scope, 'list'),
+        *(_generation_key(scope, _object_name(object_pk)) for object_pk in object_pks),
+    ])
+
+
+def invalidate_dependents(scope):
+    """Something nested into every `scope` response changed: drops all of them (on commit)."""
+    _bump_on_commit([_generation_key(scope, 'deps')])
+
+
+class CachedResponseMixin:
+    """
+    Caches anonymous GET list/retrieve responses of a viewset. Set
+    `response_cache_scope` to the name the invalidation signals use.
+    """
+    response_cache_scope = None
+    _fill_key = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, None, lambda: super(CachedResponseMixin, self).list(
+            request, *args, **kwargs
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        object_pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        return self.cached_response(request, object_pk, lambda: super(CachedResponseMixin, self).retrieve(
+            request, *args, **kwargs
+        ))
+
+    def response_cache_key(self, request, object_pk):
+        params = sorted(
+            (name, sorted(value for value in values if value))
+            for name, values in request.query_params.lists()
+            if any(values)
+        )
+        parts = [
+            request.path, repr(params), str(request.version), request.accepted_renderer.format,
+            *map(str, _generations(self.response_cache_scope, object_pk)),
+        ]
+        return f'{KEY_PREFIX}:{self.response_cache_scope}:' + hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+    def cached_response(self, request, object_pk, build_response):
+        if not settings.RESPONSE_CACHE_SECONDS or request.user.is_authenticated or request.method != 'GET':
+            return build_response()
+
+        scope = self.response_cache_scope
+        key = self.response_cache_key(request, object_pk)
+        entry = cache.get(key)
+        if entry is None and not locks.acquire(f'{key}:fill', FILL_WAIT_SECONDS):
+            # Another request is rendering this key: wait for its result.
+            metrics.incr(f'response_cache.wait.{scope}')
+            deadline = time.monotonic() + FILL_WAIT_SECONDS
+            while entry is None and time.monotonic() < deadline:
+                time.sleep(FILL_POLL_SECONDS)
+                entry = cache.get(key)
+            if entry is None:
+                return build_response()
+        elif entry is None:
+            # This request fills the key; finalize_response() stores it and releases the lock.
+            metrics.incr(f'response_cache.miss.{scope}')
+            self._fill_key = key
+            return build_response()
+
+        metrics.incr(f'response_cache.hit.{scope}')
+        return self.response_from_entry(request, entry)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key, self._fill_key = self._fill_key, None
+        if key is None:
+            return response
+        try:
+            if response.status_code == 200:
+                response.render()
+                cache.set(key, {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'headers': {name: response[name] for name in ('ETag', 'Last-Modified') if response.has_header(name)},
+                }, timeout=settings.RESPONSE_CACHE_SECONDS)
+        finally:
+            locks.release(f'{key}:fill')
+        return response
+
+    @staticmethod
+    def response_from_entry(request, entry):
+        headers = entry['headers']
+        last_modified = parse_http_date_safe(headers['Last-Modified']) if 'Last-Modified' in headers else None
+        not_modified = get_conditional_response(request, etag=headers.get('ETag'), last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        for name, value in headers.items():
+            response[name] = value
+        return response
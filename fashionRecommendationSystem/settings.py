@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 from decouple import config
 from datetime import timedelta
@@ -24,6 +25,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY')
 DEBUG = config('DEBUG', default=False, cast=bool)
 AUTH_USER_MODEL = 'users.User'
+TESTING = sys.argv[1:2] == ['test']
 
 ALLOWED_HOSTS = []
 
@@ -36,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'pgvector.django',
 
     'rest_framework',
@@ -126,7 +129,12 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "fashionRecommendationSystem.pagination.GlobalPageNumberPagination",
     "PAGE_SIZE": 20,
 
-    "DEFAULT_RENDERER_CLASSES": ["fashionRecommendationSystem.renderers.EnvelopeJSONRenderer"],
+    # Same envelope and bytes either way; FAST_JSON_RENDERER serializes with orjson.
+    "DEFAULT_RENDERER_CLASSES": [
+        "fashionRecommendationSystem.renderers.OrjsonEnvelopeRenderer"
+        if config('FAST_JSON_RENDERER', default=True, cast=bool)
+        else "fashionRecommendationSystem.renderers.EnvelopeJSONRenderer"
+    ],
     "EXCEPTION_HANDLER": "fashionRecommendationSystem.exceptions.exception_handler",
 
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
@@ -230,9 +238,123 @@ EMAIL_USE_TLS = False  # make sure this is False if using SSL
 EMAIL_HOST_USER = config('MAIL_SENDER')
 EMAIL_HOST_PASSWORD = config('MAIL_PASSWORD')  # use app password if 2FA enabled
 
+# Shared cache (reset codes, metrics, locks). Redis, so every web and worker process sees the same values.
+# CACHE_URL=locmem:// keeps it in the process instead, the default under `manage.py test`.
+CACHE_URL = config('CACHE_URL', default='locmem://' if TESTING else 'redis://localhost:6379/1')
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'} if CACHE_URL.startswith('locmem:') else {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+    }
+}
+
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Damascus'
+# One Redis list per priority, read highest first (see fashionRecommendationSystem/lanes.py).
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+
+# Queues: model-heavy tasks, light I/O tasks and FCM sends never wait behind each other.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'recommendations.tasks.process_style_image_segmentation': {'queue': 'inference'},
+    'recommendations.ai_services.style_embedding.*': {'queue': 'inference'},
+    'recommendations.tasks.finalize_style_image': {'queue': 'default'},
+    # Exact names win over the patterns below: resizing images needs no model.
+    'products.tasks.process_image_variants': {'queue': 'default'},
+    'products.tasks.*': {'queue': 'inference'},
+    'users.notifications.tasks.*': {'queue': 'notifications'},
+}
+# Worker launch profiles, picked with WORKER_PROFILE=<name> (see README). Without a profile a worker
+# consumes every queue with the defaults below, as a single development worker would.
+WORKER_PROFILES = {
+    # Long, memory-heavy tasks: few processes, one task reserved at a time, acknowledged when done.
+    'inference': {
+        'queues': ['inference'], 'concurrency': 2, 'prefetch_multiplier': 1, 'acks_late': True,
+        'load_models': True,
+    },
+    # Retrieval and other short database work.
+    'io': {
+        'queues': ['default'], 'concurrency': 8, 'prefetch_multiplier': 4, 'acks_late': False,
+        'load_models': False,
+    },
+    # Push notifications: network bound and cheap to retry.
+    'notifications': {
+        'queues': ['notifications'], 'concurrency': 16, 'prefetch_multiplier': 8, 'acks_late': False,
+        'load_models': False,
+    },
+}
+WORKER_PROFILE = config('WORKER_PROFILE', default='')
+
+# AI MODELS
+# SegFormer runtime: 'torch' (eager), 'quantized' (int8 dynamic Linear layers) or 'onnx' (onnxruntime).
+# Compare them on your own hardware with `python manage.py benchmark_segformer <images>`.
+SEGFORMER_RUNTIME = config('SEGFORMER_RUNTIME', default='torch')
+# Intra-op threads per process. Keep it low when running several Celery prefork children.
+SEGFORMER_NUM_THREADS = config('SEGFORMER_NUM_THREADS', default=1, cast=int)
+SEGFORMER_ONNX_PATH = os.path.join(BASE_DIR, 'ai_models', 'segformer_b2_clothes.onnx')
+# Uploaded style images are rotated upright and capped to this long side before segmentation.
+STYLE_IMAGE_MAX_SIDE = config('STYLE_IMAGE_MAX_SIDE', default=1024, cast=int)
+# Only upsample and cut out the person region found by the first SegFormer pass.
+STYLE_IMAGE_PERSON_CROP = config('STYLE_IMAGE_PERSON_CROP', default=True, cast=bool)
+# Run the MMFashion detector first and skip segmentation when it finds no garment (needs the ailia model files).
+SEGMENTATION_DETECTOR_GATE = config('SEGMENTATION_DETECTOR_GATE', default=False, cast=bool)
+# Load the models in every Celery worker process at start-up instead of on the first task.
+WARM_UP_AI_MODELS = config('WARM_UP_AI_MODELS', default=True, cast=bool)
+# Load the models once in the Celery parent before the prefork pool starts, so children share the weights.
+# Check the effect with `celery -A fashionRecommendationSystem inspect model_memory`.
+PRELOAD_AI_MODELS = config('PRELOAD_AI_MODELS', default=True, cast=bool)
+# Pool children are replaced after this many tasks, or once they hold this much memory of their own
+# on top of the shared models. Replacements fork from the warm parent. See fashionRecommendationSystem/worker_recycling.py.
+CELERY_WORKER_MAX_TASKS_PER_CHILD = config('CELERY_WORKER_MAX_TASKS_PER_CHILD', default=200, cast=int)
+WORKER_MAX_PRIVATE_MEMORY_MB = config('WORKER_MAX_PRIVATE_MEMORY_MB', default=1024, cast=int)
+# Segments per Style2Vec run in the style image pipeline (each run loads the model once).
+STYLE_EMBEDDING_BATCH_SIZE = config('STYLE_EMBEDDING_BATCH_SIZE', default=8, cast=int)
+# Embed segments in the segmentation task from the in-memory pixels instead of letting another task decode
+# the segment PNGs again (they are written first either way).
+STYLE_SEGMENT_MEMORY_HANDOFF = config('STYLE_SEGMENT_MEMORY_HANDOFF', default=True, cast=bool)
+# Upper bound of the per-process segment pixel cache used by that hand-off.
+SEGMENT_CACHE_MAX_MB = config('SEGMENT_CACHE_MAX_MB', default=64, cast=int)
+# Seconds a segmentation / embedding task holds its lock (see fashionRecommendationSystem/locks.py).
+# Keep it above the slowest run: a redelivered copy of the task is retried until the lock is released or expires.
+TASK_LOCK_TIMEOUT = config('TASK_LOCK_TIMEOUT', default=600, cast=int)
+# Products per catalog embedding task. Smaller batches let style uploads overtake a catalog rebuild sooner.
+CATALOG_EMBEDDING_BATCH_SIZE = config('CATALOG_EMBEDDING_BATCH_SIZE', default=16, cast=int)
+
+# PRODUCT IMAGE VARIANTS (products/image_variants.py)
+# Widths of the resized WebP and JPEG copies made of every product image (never upscaled).
+PRODUCT_IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1024)
+PRODUCT_IMAGE_WEBP_QUALITY = config('PRODUCT_IMAGE_WEBP_QUALITY', default=80, cast=int)
+PRODUCT_IMAGE_JPEG_QUALITY = config('PRODUCT_IMAGE_JPEG_QUALITY', default=82, cast=int)
+# Images per variant task when many are queued at once (catalog import, backfill).
+PRODUCT_IMAGE_VARIANT_BATCH_SIZE = config('PRODUCT_IMAGE_VARIANT_BATCH_SIZE', default=32, cast=int)
+
+# LOAD SHEDDING (recommendations/load_shedding.py)
+# Above this estimated queue wait, uploads also get cached popular products right away. 0 disables it.
+LOAD_SHEDDING_MAX_WAIT_SECONDS = config('LOAD_SHEDDING_MAX_WAIT_SECONDS', default=60, cast=int)
+# How long a queue depth reading is reused, and the per-upload cost assumed before any is measured.
+LOAD_SHEDDING_CHECK_SECONDS = config('LOAD_SHEDDING_CHECK_SECONDS', default=5, cast=int)
+LOAD_SHEDDING_DEFAULT_UPLOAD_SECONDS = config('LOAD_SHEDDING_DEFAULT_UPLOAD_SECONDS', default=10, cast=int)
+DEGRADED_RESULT_SIZE = config('DEGRADED_RESULT_SIZE', default=20, cast=int)
+POPULAR_PRODUCTS_CACHE_SECONDS = config('POPULAR_PRODUCTS_CACHE_SECONDS', default=600, cast=int)
+
+# UPLOAD THROTTLING (fashionRecommendationSystem/throttling.py)
+# Token buckets per user tier (staff, a group name, or default); an upload costs about
+# segmentation + embedding x average segments per upload tokens.
+UPLOAD_THROTTLE_TIERS = {
+    'default': {'capacity': 40, 'refill_per_minute': 8},
+    'premium': {'capacity': 120, 'refill_per_minute': 30},
+    'staff': {'capacity': 400, 'refill_per_minute': 200},
+}
+UPLOAD_THROTTLE_COSTS = {'segmentation': 4, 'embedding': 1, 'default_segments': 3}
+
+# Seconds anonymous product/category responses stay in the response cache (0 disables it).
+# Entries are invalidated on change by signals; see fashionRecommendationSystem/response_cache.py.
+RESPONSE_CACHE_SECONDS = config('RESPONSE_CACHE_SECONDS', default=300, cast=int)
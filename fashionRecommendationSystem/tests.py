@@ -0,0 +1,124 @@
+import datetime
+import uuid
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from rest_framework.response import Response
+
+from . import locks, metrics, worker_recycling
+from .renderers import EnvelopeJSONRenderer, OrjsonEnvelopeRenderer
+
+
+class OrjsonEnvelopeRendererTests(SimpleTestCase):
+    """OrjsonEnvelopeRenderer writes the same bytes as EnvelopeJSONRenderer."""
+
+    def assertSameBytes(self, data, exception=False, success_message=None):
+        response = Response(data)
+        response.exception = exception
+        if success_message:
+            response._success_message = success_message
+        context = {'response': response}
+        expected = EnvelopeJSONRenderer().render(data, 'application/json', context)
+        self.assertEqual(OrjsonEnvelopeRenderer().render(data, 'application/json', context), expected)
+        return expected
+
+    def test_scalars(self):
+        self.assertSameBytes({
+            'price': Decimal('19.90'), 'zero': Decimal('0'), 'ratio': 0.1, 'count': 3, 'flag': True,
+            'missing': None, 'text': 'Café ☕', 'items': [1, 'two', 3.5], 'tuple': (1, 2),
+        })
+
+    def test_uuid(self):
+        self.assertSameBytes({'id': uuid.UUID('12345678-1234-5678-1234-567812345678'), 'ids': [uuid.uuid4()]})
+
+    def test_datetimes(self):
+        self.assertSameBytes({
+            'aware': datetime.datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'offset': datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=3))),
+            'naive': datetime.datetime(2024, 5, 1, 12, 30, 15, 123456),
+            'whole_seconds': datetime.datetime(2024, 5, 1, 12, 30, 15),
+            'date': datetime.date(2024, 5, 1),
+            'time': datetime.time(8, 15, 30, 250000),
+            'duration': datetime.timedelta(minutes=90),
+        })
+
+    def test_non_str_keys(self):
+        self.assertSameBytes({1: 'int', 2.5: 'float', False: 'bool', None: 'none', 'str': {3: 'nested'}})
+
+    def test_line_and_paragraph_separators(self):
+        body = self.assertSameBytes({'text': 'line\u2028break\u2029end'})
+        self.assertIn(b'\\u2028', body)
+        self.assertIn(b'\\u2029', body)
+
+    def test_error_envelope(self):
+        body = self.assertSameBytes({'detail': 'Not found.'}, exception=True)
+        self.assertIn(b'"success":false', body)
+
+    def test_paginated_envelope(self):
+        self.assertSameBytes({
+            'data': [{'id': uuid.uuid4(), 'price': Decimal('5.00')}], 'count': 1, 'total_pages': 1, 'page': 1,
+            'page_size': 10, 'next': None, 'prev': None, 'first': 'http://testserver/api/products/?page=1',
+            'last': 'http://testserver/api/products/?page=1',
+        }, success_message='Products loaded.')
+
+    def test_list_and_empty_responses(self):
+        self.assertSameBytes([{'id': 1}, {'id': 2}])
+        self.assertEqual(OrjsonEnvelopeRenderer().render(None, 'application/json', {}), b'')
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    @staticmethod
+    def unregister(name):
+        names = metrics.cache.get(metrics.NAMES_KEY) or []
+        metrics.cache.set(metrics.NAMES_KEY, [other for other in names if other != name], timeout=None)
+        metrics.cache.delete(metrics._key(name))
+        metrics._registered.discard(name)
+
+    def test_name_is_registered_once_the_registry_lock_is_free(self):
+        name = f'test.{uuid.uuid4().hex}'
+        self.addCleanup(self.unregister, name)
+        self.assertTrue(locks.acquire(metrics.NAMES_KEY, 5))
+        try:
+            metrics.incr(name)
+            self.assertNotIn(name, metrics.snapshot())
+        finally:
+            locks.release(metrics.NAMES_KEY)
+
+        metrics.incr(name)
+        self.assertEqual(metrics.snapshot()[name], 2)
+
+
+@override_settings(WORKER_MAX_PRIVATE_MEMORY_MB=100)
+class WorkerRecyclingTests(SimpleTestCase):
+    MB = 2 ** 20
+
+    def setUp(self):
+        self.process = mock.Mock()
+        patcher = mock.patch.object(worker_recycling.psutil, 'Process', return_value=self.process)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(worker_recycling._baseline.update, rss=None)
+
+    def test_limit_and_private_memory_share_the_parent_baseline(self):
+        worker = SimpleNamespace()
+        self.process.memory_info.return_value = SimpleNamespace(rss=2000 * self.MB, shared=50 * self.MB)
+        worker_recycling.configure_memory_limit(worker)
+        self.assertEqual(worker.max_memory_per_child, (2000 + 100) * 1024)
+
+        # A forked child: the preloaded model's copy-on-write pages are in its RSS but not "private".
+        self.process.memory_info.return_value = SimpleNamespace(rss=2030 * self.MB, shared=50 * self.MB)
+        self.assertEqual(worker_recycling.private_memory_mb(), 30)
+        with mock.patch.object(worker_recycling.gc, 'collect') as collect:
+            worker_recycling.on_task_finished()
+        collect.assert_not_called()
+
+        self.process.memory_info.return_value = SimpleNamespace(rss=2090 * self.MB, shared=50 * self.MB)
+        with mock.patch.object(worker_recycling.gc, 'collect') as collect:
+            worker_recycling.on_task_finished()
+        collect.assert_called_once()
+
+    def test_without_a_baseline_private_memory_is_the_uss(self):
+        self.process.memory_full_info.return_value = SimpleNamespace(uss=300 * self.MB)
+        self.assertEqual(worker_recycling.private_memory_mb(), 300)
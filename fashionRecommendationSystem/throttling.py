@@ -0,0 +1,141 @@
+"""
+Cost-aware throttling of style uploads.
+
+Each user has a token bucket: it holds up to `capacity` tokens and refills at
+`refill_per_minute`. An upload is charged its expected pipeline cost, one
+segmentation plus the embeddings of the segments an upload yields on average,
+so the limit follows the inference work a user causes rather than the request
+count. The bucket lives in Redis (one atomic Lua script per check, shared by
+every web process); without a Redis cache a per-process bucket stands in.
+
+Limits come from UPLOAD_THROTTLE_TIERS: staff users get the `staff` tier, other
+users the first of their groups that names a tier, or `default`. Decisions are
+counted as `throttle.upload.allowed.<tier>` and `throttle.upload.throttled.<tier>`.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class LocalTokenBuckets:
+    """In-process stand-in for the Redis buckets (development, tests)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, capacity, rate, cost, now):
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(now - ts, 0) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            return wait
+
+
+class RedisTokenBuckets:
+    def __init__(self, client):
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, key, capacity, rate, cost, now):
+        return float(self._script(keys=[key], args=[capacity, rate, now, cost]))
+
+
+_buckets = None
+
+
+def token_buckets():
+    """The Redis buckets when the default cache is Redis, the local stand-in otherwise."""
+    global _buckets
+    if _buckets is None:
+        cache_client = getattr(cache, '_cache', None)
+        if cache_client is not None and hasattr(cache_client, 'get_client'):
+            _buckets = RedisTokenBuckets(cache_client.get_client(write=True))
+        else:
+            _buckets = LocalTokenBuckets()
+    return _buckets
+
+
+def upload_tier(user):
+    tiers = settings.UPLOAD_THROTTLE_TIERS
+    if user.is_staff and 'staff' in tiers:
+        return 'staff'
+    for group in user.groups.values_list('name', flat=True):
+        if group in tiers:
+            return group
+    return 'default'
+
+
+def expected_upload_cost():
+    """One segmentation plus the average number of segments (embeddings) per upload."""
+    costs = settings.UPLOAD_THROTTLE_COSTS
+    uploads = metrics.value('pipeline.segmentation.count')
+    segments = metrics.value('pipeline.segments')
+    segments_per_upload = segments / uploads if uploads else costs['default_segments']
+    return costs['segmentation'] + costs['embedding'] * segments_per_upload
+
+
+class UploadCostThrottle(BaseThrottle):
+    """
+    Throttles the `create` action of a viewset by the expected pipeline cost of
+    an upload. Rejected requests get 429 with a Retry-After header.
+    """
+
+    def allow_request(self, request, view):
+        self._wait = None
+        if getattr(view, 'action', None) != 'create' or not request.user.is_authenticated:
+            return True
+
+        tier = upload_tier(request.user)
+        limits = settings.UPLOAD_THROTTLE_TIERS[tier]
+        rate = limits['refill_per_minute'] / 60
+        # An upload never costs more than a full bucket, or it could never pass.
+        cost = min(expected_upload_cost(), limits['capacity'])
+        try:
+            wait = token_buckets().take(
+                f'throttle:upload:{request.user.pk}', limits['capacity'], rate, cost, time.time()
+            )
+        except Exception as e:
+            # Fail open: a broken cache must not block every upload.
+            print(f"Upload throttle unavailable: {e}")
+            return True
+
+        if wait > 0:
+            self._wait = wait
+            metrics.incr(f'throttle.upload.throttled.{tier}')
+            return False
+        metrics.incr(f'throttle.upload.allowed.{tier}')
+        return True
+
+    def wait(self):
+        return math.ceil(self._wait) if self._wait else None
@@ -19,6 +19,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     # Add djoser's core authentication URLs
@@ -31,5 +33,6 @@ urlpatterns = [
     path('api/', include('orders.urls')),
     path('api/', include('wallet.urls')),
     path('api/', include('recommendations.urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
@@ -0,0 +1,101 @@
+"""
+Memory-aware recycling of Celery pool children.
+
+Celery replaces a pool child after CELERY_WORKER_MAX_TASKS_PER_CHILD tasks, or
+once its resident memory passes the worker's `max_memory_per_child`. With the
+models preloaded in the parent (PRELOAD_AI_MODELS) every child's RSS already
+includes the shared weights, so the limit is set at start-up to the parent's
+RSS plus WORKER_MAX_PRIVATE_MEMORY_MB: children are recycled for the memory
+they accumulated themselves (PIL buffers, allocator caches), not for the model.
+Replacements are forked from the warm parent and start without loading a model.
+
+Every child exit is counted as `worker.exit.<reason>` (max_tasks, max_memory,
+shutdown or failure) and child start-up time as `worker.child_start`.
+"""
+import ctypes
+import gc
+import os
+import sys
+import time
+
+import psutil
+from billiard.pool import EX_RECYCLE
+from django.conf import settings
+
+from . import metrics
+
+# Fraction of the private budget past which a child tries to hand memory back.
+TRIM_THRESHOLD = 0.8
+
+_child = {'tasks': 0, 'started': time.monotonic()}
+# The parent's RSS when the limit was set, inherited by every forked child.
+_baseline = {'rss': None}
+
+
+def private_memory_mb():
+    """
+    Memory this child added on top of the parent it was forked from: its RSS
+    above the parent's baseline, the same measure the recycling limit uses.
+    RSS minus shared pages would not do, since the copy-on-write pages of a
+    preloaded model count as anonymous. Without a baseline it is the USS.
+    """
+    process = psutil.Process()
+    if _baseline['rss'] is None:
+        return process.memory_full_info().uss / 2 ** 20
+    return max(process.memory_info().rss - _baseline['rss'], 0) / 2 ** 20
+
+
+def configure_memory_limit(worker):
+    """Sets the worker's per-child memory limit to the parent's RSS plus the private budget."""
+    budget_mb = settings.WORKER_MAX_PRIVATE_MEMORY_MB
+    if not budget_mb:
+        return
+    _baseline['rss'] = psutil.Process().memory_info().rss
+    baseline_kb = _baseline['rss'] // 1024
+    worker.max_memory_per_child = baseline_kb + budget_mb * 1024
+    print(f"Celery Worker {os.getpid()}: recycling children above {worker.max_memory_per_child // 1024} MB RSS "
+          f"({baseline_kb // 1024} MB baseline + {budget_mb} MB private) "
+          f"or after {settings.CELERY_WORKER_MAX_TASKS_PER_CHILD or 'unlimited'} tasks.")
+
+
+def on_child_ready(started):
+    """Called once a freshly forked child is ready to take tasks."""
+    _child['started'] = started
+    metrics.observe('worker.child_start', time.monotonic() - started)
+
+
+def on_task_finished():
+    """
+    Counts the task and, when the child gets close to its private budget,
+    returns freed memory to the OS before Celery decides to recycle it.
+    """
+    _child['tasks'] += 1
+    budget_mb = settings.WORKER_MAX_PRIVATE_MEMORY_MB
+    if not budget_mb or private_memory_mb() < budget_mb * TRIM_THRESHOLD:
+        return
+
+    gc.collect()
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    if sys.platform.startswith('linux'):
+        try:
+            ctypes.CDLL('libc.so.6').malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+    metrics.incr('worker.memory_trim')
+
+
+def on_child_exit(exitcode):
+    """Records why this child is exiting."""
+    max_tasks = settings.CELERY_WORKER_MAX_TASKS_PER_CHILD
+    if exitcode == EX_RECYCLE:
+        reason = 'max_tasks' if max_tasks and _child['tasks'] >= max_tasks else 'max_memory'
+    elif exitcode == 0:
+        reason = 'shutdown'
+    else:
+        reason = 'failure'
+
+    metrics.incr(f'worker.exit.{reason}')
+    print(f"Celery Worker {os.getpid()}: exiting ({reason}) after {_child['tasks']} tasks "
+          f"and {time.monotonic() - _child['started']:.0f}s, {private_memory_mb():.0f} MB private memory.")
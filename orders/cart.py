@@ -1,3 +1,6 @@
+from django.db.models import Prefetch, prefetch_related_objects
+
+from products.models import Product
 from .models import Cart
 
 def get_or_create_cart(request):
@@ -18,4 +21,18 @@ def get_or_create_cart(request):
         session_key = request.session.session_key
 
     cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
\ No newline at end of file
+    return cart
+
+
+def prefetch_cart_items(cart, fieldset=None):
+    """
+    Loads the cart's items and their products (without vector columns) in a few
+    queries, so serializing the cart or checking out does not query per item.
+    `fieldset` limits the products to what the response shows; their prices
+    are always loaded for the item and cart totals.
+    """
+    prefetch_related_objects([cart], Prefetch(
+        'items__product',
+        queryset=Product.objects.for_catalog(fieldset, also=('base_price', 'discount_percent')),
+    ))
+    return cart
@@ -60,6 +60,12 @@ class Transaction(models.Model):
     def __str__(self):
         return f"{self.type} - ${self.amount} ({self.reference})"
 
+    class Meta:
+        indexes = [
+            # Keyset pagination order (see KeysetPagination)
+            models.Index(fields=['created_at', 'transactionId'], name='txn_created_pk_idx'),
+        ]
+
 
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, name="cartId")
@@ -1,3 +1,70 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from products.tests import create_catalog, selected_vector_columns
+from users.models import User
+from .models import Cart, CartItem, Order, OrderItem, Transaction
+
+PAGE_KEYS = {'success', 'message', 'data', 'count', 'total_pages', 'page', 'page_size', 'next', 'prev', 'first', 'last'}
+
+
+class TransactionPaginationTests(TestCase):
+    """TransactionViewSet uses KeysetPagination but keeps the page-number envelope."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='password123')
+        Transaction.objects.bulk_create([
+            Transaction(type=Transaction.Type.DEPOSIT, amount=i, reference=f'ref_{i}') for i in range(15)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_keyset_pages_keep_the_envelope(self):
+        body = self.client.get('/api/transactions/').json()
+        self.assertLessEqual(PAGE_KEYS, body.keys())
+        self.assertIsNone(body['page'])
+        self.assertEqual(len(body['data']), 10)
+
+        second = self.client.get(body['next']).json()
+        self.assertEqual(len(second['data']), 5)
+        self.assertIsNone(second['next'])
+        seen = {row['transactionId'] for row in body['data'] + second['data']}
+        self.assertEqual(len(seen), 15)
+
+    def test_page_numbers_still_work(self):
+        body = self.client.get('/api/transactions/', {'page': 2}).json()
+        self.assertLessEqual(PAGE_KEYS, body.keys())
+        self.assertEqual(body['page'], 2)
+        self.assertEqual(body['total_pages'], 2)
+        self.assertEqual(len(body['data']), 5)
+
+
+class ProductColumnTests(TestCase):
+    """Cart and order reads load their products without the vector columns."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', email='shopper@example.com', password='password123')
+        products = create_catalog(2)
+        cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=2) for product in products])
+        cls.order = Order.objects.create(user=cls.user)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.order, product=product, unit_price=product.base_price) for product in products
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_cart_and_orders(self):
+        for url in ('/api/cart/', '/api/orders/', f'/api/orders/{self.order.pk}/'):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(selected_vector_columns(queries), set())
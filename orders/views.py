@@ -1,15 +1,18 @@
 from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from fashionRecommendationSystem.pagination import KeysetPagination
+from products.fieldsets import ProductFieldset
 from wallet.models import Wallet
 from .models import Order, OrderItem, Transaction, Product, Cart, CartItem
 from .serializers import (
     OrderSerializer, TransactionSerializer, CartSerializer,
     AddCartItemSerializer, CartItemSerializer, UpdateCartItemSerializer
 )
-from .cart import get_or_create_cart
+from .cart import get_or_create_cart, prefetch_cart_items
 
 
 # --- Order and Transaction Views (Now Simpler) ---
@@ -26,9 +29,14 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         """Admins see all orders, regular users only see their own."""
         user = self.request.user
+        # Products through the default manager, so their vector columns are not loaded,
+        # limited to the ?fields= / ?expand= selection
+        items_product = Prefetch(
+            'items__product', queryset=Product.objects.for_catalog(ProductFieldset.from_request(self.request))
+        )
         if user.is_staff:
-            return Order.objects.all().prefetch_related('items__product')
-        return Order.objects.filter(user=user).prefetch_related('items__product')
+            return Order.objects.all().prefetch_related(items_product)
+        return Order.objects.filter(user=user).prefetch_related(items_product)
 
 
 class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
@@ -38,6 +46,7 @@ class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = KeysetPagination
 
 
 # --- Cart and Cart Item Views (New Structure) ---
@@ -51,8 +60,9 @@ class CartViewSet(viewsets.ViewSet):
 
     def list(self, request):
         """GET /api/cart/ - Retrieve the current user's or session's cart."""
-        cart = get_or_create_cart(request)
-        serializer = CartSerializer(cart)
+        fieldset = ProductFieldset.from_request(request)
+        cart = prefetch_cart_items(get_or_create_cart(request), fieldset)
+        serializer = CartSerializer(cart, context={'product_fieldset': fieldset})
         return Response(serializer.data)
 
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
@@ -61,8 +71,8 @@ class CartViewSet(viewsets.ViewSet):
         POST /api/cart/checkout/ - Creates an Order from the cart
         and deducts the total amount from the user's wallet.
         """
-        cart = get_or_create_cart(request)
-        if not cart.items.exists():
+        cart = prefetch_cart_items(get_or_create_cart(request))
+        if not cart.items.all():
             return Response({'error': 'Your cart is empty.'}, status=status.HTTP_400_BAD_REQUEST)
 
         order_total = cart.total_price
@@ -148,6 +158,7 @@ class CartItemViewSet(viewsets.ModelViewSet):
             product=product,
             defaults={'quantity': quantity}
         )
+        cart_item.product = product  # already loaded, without its vector columns
         # If the item was not new, we add to its quantity
         if not created:
             cart_item.quantity += quantity
@@ -1,10 +1,13 @@
 from django.contrib import admin
 from django.contrib.admin import SimpleListFilter
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.urls import reverse
-from django.db.models import Count, Avg
+from django.db.models import Count, Avg, BooleanField, ExpressionWrapper, Q
 from products.models import Product, Category, ProductSize, ProductImage
+from fashionRecommendationSystem import response_cache
+from products.tasks import queue_product_embeddings
 
 
 @admin.register(Category)
@@ -74,7 +77,7 @@ class ProductImageInline(admin.TabularInline):
         if obj.image and hasattr(obj.image, 'url'):
             return format_html(
                 '<img src="{}" width="80" height="80" style="border-radius: 4px; object-fit: cover;" />',
-                obj.image.url
+                obj.thumbnail_url(160)
             )
         return "No image"
 
@@ -183,7 +186,7 @@ class ProductAdmin(admin.ModelAdmin):
         if first_image and first_image.image:
             return format_html(
                 '<img src="{}" width="50" height="50" style="border-radius: 4px; object-fit: cover;" />',
-                first_image.image.url
+                first_image.thumbnail_url(100)
             )
         return mark_safe('<span style="color: #999;">No image</span>')
 
@@ -193,28 +196,41 @@ class ProductAdmin(admin.ModelAdmin):
 
     @admin.display(description='AI Embedding')
     def get_embedding_status(self, obj):
-        if obj.embedding:
+        # The changelist annotates has_embedding instead of loading the vectors
+        has_embedding = getattr(obj, 'has_embedding', None)
+        if has_embedding is None:
+            has_embedding = obj.embedding is not None
+        if has_embedding:
             return format_html('<span style="color: #27ae60;">✓ Generated</span>')
         return format_html('<span style="color: #e74c3c;">✗ Missing</span>')
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related('categories', 'sizes', 'images')
+        return qs.prefetch_related('categories', 'sizes', 'images').annotate(
+            has_embedding=ExpressionWrapper(Q(embedding__isnull=False), output_field=BooleanField())
+        )
 
     @admin.action(description='Generate AI embeddings for selected products')
     def generate_embeddings(self, request, queryset):
-        # This would trigger the embedding generation task
-        count = queryset.filter(embedding__isnull=True).count()
-        self.message_user(request, f'Embedding generation queued for {count} products.')
+        # Queued in the batch lane, so it never delays users' style uploads
+        product_ids = list(queryset.filter(embedding__isnull=True).values_list('productId', flat=True))
+        tasks = queue_product_embeddings(product_ids)
+        self.message_user(request, f'Embedding generation queued for {len(product_ids)} products ({tasks} tasks).')
 
     @admin.action(description='Apply 10%% discount to selected products')
     def apply_discount(self, request, queryset):
-        updated = queryset.update(discount_percent=10)
+        # update() sends no signals: bump updated_at so conditional GETs see the change
+        # and drop the cached responses, as the receivers in signals.py would.
+        product_ids = list(queryset.values_list('pk', flat=True))
+        updated = queryset.update(discount_percent=10, updated_at=timezone.now())
+        response_cache.invalidate('products', product_ids)
         self.message_user(request, f'10% discount applied to {updated} products.')
 
     @admin.action(description='Mark selected products as out of stock')
     def mark_out_of_stock(self, request, queryset):
-        updated = queryset.update(stock_quantity=0)
+        product_ids = list(queryset.values_list('pk', flat=True))
+        updated = queryset.update(stock_quantity=0, updated_at=timezone.now())
+        response_cache.invalidate('products', product_ids)
         self.message_user(request, f'{updated} products marked as out of stock.')
 
 
@@ -249,6 +265,6 @@ class ProductImageAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" width="100" height="100" style="border-radius: 8px; object-fit: cover;" />',
-                obj.image.url
+                obj.thumbnail_url(200)
             )
         return "No image"
@@ -0,0 +1,49 @@
+"""
+Sparse fieldsets and expansion control for product representations.
+
+Every endpoint that returns products (the catalog, the cart, orders) reads two
+optional query parameters on GET:
+
+* `?fields=productId,name,final_price` keeps only the listed product fields;
+* `?expand=images` keeps `categories`, `sizes` and `images` as nested objects
+  only when listed, the others are returned as lists of primary keys
+  (`?expand=` returns all three as keys). Without it everything is nested.
+
+The same selection prunes the query (see ProductQuerySet.for_catalog): only
+the selected columns are loaded, unselected relations are not prefetched and
+unexpanded ones are prefetched as keys only. Unknown names are ignored.
+"""
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+# Nested relations of ProductSerializer that ?expand= controls.
+RELATIONS = ('categories', 'sizes', 'images')
+
+
+def _names(value):
+    if value is None:
+        return None
+    return frozenset(name.strip() for name in value.split(',') if name.strip())
+
+
+class ProductFieldset:
+    """The product fields and expanded relations a request asked for (None means all)."""
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request):
+        # Writes always get (and validate against) the full representation.
+        if request is None or request.method not in SAFE_METHODS:
+            return cls()
+        return cls(_names(request.query_params.get(FIELDS_PARAM)), _names(request.query_params.get(EXPAND_PARAM)))
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return self.includes(name) and (self.expand is None or name in self.expand)
@@ -0,0 +1,79 @@
+"""
+Resized WebP and JPEG copies of product images, for srcset.
+
+Variants are content-addressed: they are stored under the SHA-256 of the
+original file, so the same photo uploaded twice (or re-imported) is encoded
+once, and a replaced image never serves stale copies. Each ProductImage keeps
+the names in its `variants` field, together with the image name they were made
+from; until the task has run, the API and admin fall back to the original.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+VARIANT_DIR = 'products/variants'
+
+# (variants key, Pillow format, file extension, MIME type), best format first.
+FORMATS = (
+    ('webp', 'WEBP', 'webp', 'image/webp'),
+    ('jpeg', 'JPEG', 'jpg', 'image/jpeg'),
+)
+
+
+def _encode(image, pillow_format):
+    buffer = io.BytesIO()
+    if pillow_format == 'WEBP':
+        image.save(buffer, format='WEBP', quality=settings.PRODUCT_IMAGE_WEBP_QUALITY, method=4)
+    else:
+        image.save(buffer, format='JPEG', quality=settings.PRODUCT_IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def build_variants(image_field):
+    """
+    Creates the missing variants of an image (a FieldFile) in its storage and
+    returns the value for ProductImage.variants.
+    """
+    storage = image_field.storage
+    with image_field.open('rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    with Image.open(io.BytesIO(data)) as original:
+        # Phone photos are often stored sideways with an EXIF rotation.
+        original = ImageOps.exif_transpose(original).convert('RGB')
+    widths = sorted({min(width, original.width) for width in settings.PRODUCT_IMAGE_VARIANT_WIDTHS})
+
+    variants = {'source': image_field.name, 'hash': digest}
+    for key, _, _, _ in FORMATS:
+        variants[key] = []
+    for width in widths:
+        height = max(round(original.height * width / original.width), 1)
+        resized = None
+        for key, pillow_format, extension, _ in FORMATS:
+            name = f'{VARIANT_DIR}/{digest[:2]}/{digest}/{width}.{extension}'
+            if not storage.exists(name):
+                if resized is None:
+                    resized = original.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+                name = storage.save(name, ContentFile(_encode(resized, pillow_format)))
+            variants[key].append({'width': width, 'height': height, 'name': name})
+    return variants
+
+
+def srcset(product_image, build_url):
+    """
+    {MIME type: srcset string} for a ProductImage, best format first; empty
+    while its variants are missing or were made from a previous file.
+    `build_url` turns a storage URL into the URL the client gets.
+    """
+    if not product_image.variants_current():
+        return {}
+    storage = product_image.image.storage
+    return {
+        mime_type: ', '.join(f"{build_url(storage.url(v['name']))} {v['width']}w" for v in product_image.variants[key])
+        for key, _, _, mime_type in FORMATS
+        if product_image.variants.get(key)
+    }
@@ -0,0 +1,96 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.filters import ProductSearchFilter
+from products.models import Product
+
+# Synthetic catalog rows, generated in SQL so a million rows take seconds.
+INSERT_PRODUCTS = """
+INSERT INTO products_product
+    ("productId", sku, name, description, base_price, discount_percent, stock_quantity, gender, created_at, updated_at)
+SELECT
+    gen_random_uuid(),
+    'BENCH-' || lpad(i::text, 8, '0'),
+    (ARRAY['Classic', 'Slim', 'Oversized', 'Vintage', 'Cropped', 'Relaxed', 'Pleated', 'Knitted'])[1 + i %% 8] || ' ' ||
+    (ARRAY['Denim', 'Linen', 'Cotton', 'Wool', 'Leather', 'Silk', 'Corduroy'])[1 + i %% 7] || ' ' ||
+    (ARRAY['Jacket', 'Shirt', 'Dress', 'Skirt', 'Trousers', 'Sweater', 'Coat', 'Shorts', 'Blazer'])[1 + i %% 9],
+    'A ' || (ARRAY['comfortable', 'lightweight', 'warm', 'breathable', 'elegant'])[1 + i %% 5] ||
+    ' piece for ' || (ARRAY['summer', 'winter', 'office', 'weekend', 'evening', 'travel'])[1 + i %% 6] ||
+    ' wear, made from ' || (ARRAY['organic', 'recycled', 'premium', 'washed'])[1 + i %% 4] || ' fabric. Item ' || i,
+    10 + (i %% 190), 0, i %% 50, (ARRAY['Male', 'Female', 'Unisex'])[1 + i %% 3], now(), now()
+FROM generate_series(1, %s) AS i
+"""
+
+
+class Command(BaseCommand):
+    help = ('Compares the old ICONTAINS product search with ProductSearchFilter on synthetic catalogs. '
+            'Rows are inserted inside a transaction that is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[100_000, 1_000_000],
+            help='Catalog sizes to benchmark (synthetic rows added on top of the existing catalog).'
+        )
+        parser.add_argument(
+            '--terms',
+            nargs='+',
+            default=['linen jacket', 'vintage', 'BENCH-0004242', 'sweter'],
+            help='Search terms (include a typo to exercise trigram matching).'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'rows':>10} {'term':<16} {'icontains ms':>13} {'search ms':>10} {'hits':>7}")
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self.fill_catalog(size)
+                    for term in options['terms']:
+                        self.compare(size, term, options['repeat'])
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+    def fill_catalog(self, size):
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(INSERT_PRODUCTS, [size])
+            cursor.execute('ANALYZE products_product')
+        self.stdout.write(self.style.SUCCESS(f"Inserted {size} products in {time.perf_counter() - started:.1f}s"))
+
+    def compare(self, size, term, repeat):
+        # The search_fields the viewset used before: ICONTAINS over four columns.
+        legacy = Product.objects.filter(
+            Q(productId__icontains=term) | Q(name__icontains=term) | Q(sku__icontains=term)
+            | Q(description__icontains=term)
+        ).order_by('-created_at')
+
+        request = Request(APIRequestFactory().get('/api/products/', {'search': term}))
+        indexed = ProductSearchFilter().filter_queryset(request, Product.objects.all(), view=None)
+
+        legacy_ms = self.time_query(legacy, repeat)
+        indexed_ms = self.time_query(indexed, repeat)
+        self.stdout.write(f"{size:>10} {term:<16} {legacy_ms:>13.1f} {indexed_ms:>10.1f} {indexed.count():>7}")
+
+    @staticmethod
+    def time_query(queryset, repeat):
+        """Median time of fetching the first page (20 rows), as the API would."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.values_list('pk', flat=True)[:20])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+
+class _Rollback(Exception):
+    """Raised to roll the synthetic rows back once a size is measured."""
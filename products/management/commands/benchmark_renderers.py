@@ -0,0 +1,68 @@
+import itertools
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from fashionRecommendationSystem.renderers import EnvelopeJSONRenderer, OrjsonEnvelopeRenderer
+from products.models import Product
+from products.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = ('Renders product list pages with EnvelopeJSONRenderer and OrjsonEnvelopeRenderer, '
+            'checks that both produce the same bytes and compares their throughput.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-sizes',
+            type=int,
+            nargs='+',
+            default=[20, 100, 500],
+            help='Products per rendered page (the catalog is cycled when it is smaller).'
+        )
+        parser.add_argument('--repeat', type=int, default=50, help='Timed renders per page size and renderer.')
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/api/products/'))
+        products = list(Product.objects.for_catalog()[:max(options['page_sizes'])])
+        if not products:
+            raise CommandError("The catalog is empty: add products before benchmarking.")
+        # Serialized once: only the rendering step is measured.
+        serialized = ProductSerializer(products, many=True, context={'request': request}).data
+
+        self.stdout.write(f"{'products':>9} {'KiB':>8} {'json ms':>9} {'orjson ms':>10} {'speed-up':>9}")
+        for page_size in options['page_sizes']:
+            data = list(itertools.islice(itertools.cycle(serialized), page_size))
+            page = {'data': data, 'count': len(data), 'page': 1, 'page_size': page_size, 'next': None, 'prev': None}
+
+            expected = self.render(EnvelopeJSONRenderer(), page)
+            actual = self.render(OrjsonEnvelopeRenderer(), page)
+            if actual != expected:
+                offset = next((i for i, (a, b) in enumerate(zip(actual, expected)) if a != b), len(expected))
+                self.stdout.write(self.style.ERROR(
+                    f"{page_size} products: outputs differ at byte {offset}: "
+                    f"json {expected[offset - 40:offset + 40]!r} / orjson {actual[offset - 40:offset + 40]!r}"))
+
+            json_ms = self.time_render(EnvelopeJSONRenderer(), page, options['repeat'])
+            orjson_ms = self.time_render(OrjsonEnvelopeRenderer(), page, options['repeat'])
+            self.stdout.write(f"{page_size:>9} {len(expected) / 1024:>8.1f} {json_ms:>9.2f} {orjson_ms:>10.2f} "
+                              f"{json_ms / orjson_ms:>8.1f}x")
+
+    @staticmethod
+    def render(renderer, page):
+        response = Response(page)
+        response._success_message = "OK"
+        return renderer.render(page, 'application/json', {'response': response})
+
+    def time_render(self, renderer, page, repeat):
+        """Median time of rendering the page once."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self.render(renderer, page)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from products.models import ProductImage
+from products.tasks import queue_image_variants
+
+
+class Command(BaseCommand):
+    help = ('Queues the resized WebP/JPEG variants of product images that have none yet, '
+            'or whose variants were made from a previous file (e.g. images uploaded before variants existed).')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.only('id', 'image', 'variants')
+        image_ids = [image.id for image in images.iterator(chunk_size=2000) if not image.variants_current()]
+        if not image_ids:
+            self.stdout.write(self.style.SUCCESS("Every product image has current variants."))
+            return
+        tasks = queue_image_variants(image_ids)
+        self.stdout.write(self.style.SUCCESS(f"Queued variants for {len(image_ids)} images in {tasks} tasks."))
@@ -0,0 +1,280 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from tqdm import tqdm
+
+from fashionRecommendationSystem import response_cache
+from products.models import Category, Product, ProductImage, ProductSize
+from products.tasks import queue_image_variants, queue_product_embeddings
+
+# Columns staged with COPY, in order.
+STAGE_COLUMNS = ('sku', 'name', 'description', 'base_price', 'discount_percent', 'stock_quantity', 'gender')
+
+CREATE_STAGE = """
+CREATE TEMP TABLE catalog_import_stage (
+    sku text,
+    name text,
+    description text,
+    base_price numeric(10, 2),
+    discount_percent numeric(5, 2),
+    stock_quantity integer,
+    gender text
+) ON COMMIT DROP
+"""
+
+# Existing SKUs are updated first; columns left empty in the file keep their
+# current value. The embedding is never touched here: it is only recomputed
+# for products that get a new image.
+UPDATE_PRODUCTS = """
+UPDATE products_product AS p SET
+    name = s.name,
+    description = COALESCE(s.description, p.description),
+    base_price = s.base_price,
+    discount_percent = COALESCE(s.discount_percent, p.discount_percent),
+    stock_quantity = COALESCE(s.stock_quantity, p.stock_quantity),
+    gender = COALESCE(s.gender, p.gender),
+    updated_at = now()
+FROM catalog_import_stage AS s
+WHERE p.sku = s.sku
+RETURNING p."productId", p.sku
+"""
+
+INSERT_PRODUCTS = """
+INSERT INTO products_product
+    ("productId", sku, name, description, base_price, discount_percent, stock_quantity, gender, created_at, updated_at)
+SELECT gen_random_uuid(), s.sku, s.name, COALESCE(s.description, ''), s.base_price, COALESCE(s.discount_percent, 0),
+       COALESCE(s.stock_quantity, 0), s.gender, now(), now()
+FROM catalog_import_stage AS s
+WHERE NOT EXISTS (SELECT 1 FROM products_product AS p WHERE p.sku = s.sku)
+ON CONFLICT (sku) DO NOTHING
+RETURNING "productId", sku
+"""
+
+
+class Command(BaseCommand):
+    help = ('Imports a CSV or JSONL catalog in bulk: rows are staged with COPY and upserted by SKU, '
+            'categories and sizes are linked in bulk, images are copied into media storage in parallel '
+            'and embeddings are queued as batch-lane tasks. Columns: sku, name, price, and optionally '
+            'description, discount_percent, stock_quantity, gender, category/categories, sizes and '
+            'image/images (several values separated by "|").')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Catalog file (.csv or .jsonl).')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='File format (default: from the extension).')
+        parser.add_argument(
+            '--images-dir',
+            help='Directory the image files are looked up in by file name '
+                 '(default: image paths are relative to the catalog file).'
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per COPY and transaction.')
+        parser.add_argument('--workers', type=int, default=8, help='Threads copying images into media storage.')
+        parser.add_argument('--no-embeddings', action='store_true', help='Do not queue embedding tasks.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Catalog file "{path}" does not exist.')
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.images_dir = options['images_dir'] or os.path.dirname(os.path.abspath(path))
+        self.use_basename = bool(options['images_dir'])
+        # Names are matched case-insensitively and keep the spelling already stored.
+        self.categories = _by_folded_name(Category.objects.order_by('created_at').values_list('name', 'pk'))
+        self.sizes = _by_folded_name(ProductSize.objects.order_by('label').values_list('label', 'pk'))
+        self.totals = {'inserted': 0, 'updated': 0, 'skipped': 0, 'images': 0, 'missing_images': 0, 'tasks': 0}
+
+        total_rows = _count_rows(path, file_format)
+        with open(path, encoding='utf-8', newline='') as catalog, \
+                ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool, \
+                tqdm(total=total_rows, desc="Importing catalog", unit='rows') as progress:
+            rows = csv.DictReader(catalog) if file_format == 'csv' else (json.loads(line) for line in catalog if line.strip())
+            chunk = []
+            for line, row in enumerate(rows, start=1):
+                chunk.append((line, row))
+                if len(chunk) >= options['chunk_size']:
+                    self.import_chunk(chunk, pool, options['no_embeddings'])
+                    progress.update(len(chunk))
+                    chunk = []
+            if chunk:
+                self.import_chunk(chunk, pool, options['no_embeddings'])
+                progress.update(len(chunk))
+
+        # Bulk writes send no model signals: drop the cached catalog responses once.
+        response_cache.invalidate('categories')
+        response_cache.invalidate_dependents('products')
+
+        totals = self.totals
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['inserted']} new and {totals['updated']} updated products, "
+            f"{totals['images']} images, {totals['tasks']} embedding tasks queued."))
+        if totals['skipped'] or totals['missing_images']:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {totals['skipped']} invalid rows and {totals['missing_images']} missing images."))
+
+    def import_chunk(self, chunk, pool, no_embeddings):
+        # Last row wins for a SKU repeated within the chunk (one upsert may not touch a row twice).
+        rows = {}
+        for line, row in chunk:
+            parsed = self.parse_row(line, row)
+            if parsed is None:
+                self.totals['skipped'] += 1
+            else:
+                rows[parsed['sku']] = parsed
+        if not rows:
+            return
+
+        self.ensure_names(Category, 'name', self.categories, rows, 'categories')
+        self.ensure_names(ProductSize, 'label', self.sizes, rows, 'sizes')
+
+        with transaction.atomic():
+            products = self.upsert_products(rows.values())
+            self.link(Product.categories.through, 'category_id', self.categories, rows, products, 'categories')
+            self.link(Product.sizes.through, 'productsize_id', self.sizes, rows, products, 'sizes')
+            images = self.copy_images(rows, products, pool)
+            ProductImage.objects.bulk_create(images, batch_size=1000)
+
+        self.totals['images'] += len(images)
+        if images:
+            queue_image_variants([image.id for image in images])
+        if images and not no_embeddings:
+            self.totals['tasks'] += queue_product_embeddings({image.product_id for image in images})
+
+    def parse_row(self, line, row):
+        sku = str(row.get('sku') or '').strip()
+        name = str(row.get('name') or '').strip()
+        price = str(row.get('price') or row.get('base_price') or '').strip()
+        if not sku or not name or not price:
+            tqdm.write(self.style.WARNING(f"Line {line}: sku, name and price are required, skipping."))
+            return None
+        try:
+            price = _finite_decimal(price)
+            discount = _finite_decimal(row['discount_percent']) if row.get('discount_percent') not in (None, '') else None
+            stock = int(row['stock_quantity']) if row.get('stock_quantity') not in (None, '') else None
+        except (InvalidOperation, ValueError):
+            tqdm.write(self.style.WARNING(f"Line {line}: invalid number, skipping SKU {sku or '?'}."))
+            return None
+        return {
+            'sku': sku, 'name': name, 'description': str(row.get('description') or '').strip() or None,
+            'base_price': price, 'discount_percent': discount, 'stock_quantity': stock,
+            'gender': str(row.get('gender') or '').strip() or None,
+            'categories': _values(row, 'categories', 'category'),
+            'sizes': _values(row, 'sizes', 'size'),
+            'images': _values(row, 'images', 'image'),
+        }
+
+    @staticmethod
+    def ensure_names(model, field, known, rows, key):
+        """
+        Creates the categories / sizes named in the chunk that do not exist yet,
+        in any letter case, spelled as they first appear (in sorted order).
+        """
+        missing = {}
+        for name in sorted({name for row in rows.values() for name in row[key]}):
+            if name.casefold() not in known:
+                missing.setdefault(name.casefold(), name)
+        created = model.objects.bulk_create([model(**{field: name}) for name in missing.values()])
+        known.update(_by_folded_name((getattr(instance, field), instance.pk) for instance in created))
+
+    def upsert_products(self, rows):
+        """Stages the rows with COPY and upserts them by SKU. Returns {sku: pk}."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['' if row[column] is None else row[column] for column in STAGE_COLUMNS])
+        buffer.seek(0)
+
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_STAGE)
+            cursor.copy_expert(
+                f"COPY catalog_import_stage ({', '.join(STAGE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+            cursor.execute(UPDATE_PRODUCTS)
+            products = {sku: pk for pk, sku in cursor.fetchall()}
+            self.totals['updated'] += len(products)
+            cursor.execute(INSERT_PRODUCTS)
+            inserted = {sku: pk for pk, sku in cursor.fetchall()}
+            self.totals['inserted'] += len(inserted)
+        return {**products, **inserted}
+
+    def link(self, through, target_column, known, rows, products, key):
+        """Adds the chunk's category / size links in one INSERT; existing links are kept."""
+        links = [
+            through(product_id=products[sku], **{target_column: known[name]})
+            for sku, row in rows.items()
+            for name in {name.casefold() for name in row[key]}
+        ]
+        through.objects.bulk_create(links, batch_size=5000, ignore_conflicts=True)
+
+    def copy_images(self, rows, products, pool):
+        """
+        Copies the images of products that have none yet into media storage,
+        several at a time. Returns the unsaved ProductImage rows.
+        """
+        product_ids = list(products.values())
+        with_images = set(ProductImage.objects.filter(product_id__in=product_ids).values_list('product_id', flat=True))
+
+        jobs = []
+        for sku, row in rows.items():
+            product_id = products[sku]
+            if product_id in with_images:
+                continue
+            for source in row['images']:
+                source = os.path.join(self.images_dir, os.path.basename(source) if self.use_basename else source)
+                if os.path.exists(source):
+                    jobs.append((product_id, row['name'], source))
+                else:
+                    self.totals['missing_images'] += 1
+                    tqdm.write(self.style.WARNING(f"Image not found for SKU {sku}: {source}"))
+
+        field = ProductImage._meta.get_field('image')
+        saved = pool.map(lambda job: _store_image(field, job[2]), jobs)
+        return [
+            ProductImage(product_id=product_id, image=name, alt_text=f"Image for {product_name}")
+            for (product_id, product_name, _), name in zip(jobs, saved)
+        ]
+
+
+def _by_folded_name(names_and_pks):
+    """{case-folded name: pk}; the first of several names differing only in case wins."""
+    known = {}
+    for name, pk in names_and_pks:
+        known.setdefault(name.casefold(), pk)
+    return known
+
+
+def _count_rows(path, file_format):
+    """Records in the catalog file, for the progress bar (a quoted CSV field may span lines)."""
+    with open(path, encoding='utf-8', newline='') as catalog:
+        if file_format == 'csv':
+            return sum(1 for _ in csv.DictReader(catalog))
+        return sum(1 for line in catalog if line.strip())
+
+
+def _finite_decimal(value):
+    """A Decimal from a file value; NaN and Infinity raise ValueError like any other bad number."""
+    number = Decimal(str(value).strip())
+    if not number.is_finite():
+        raise ValueError(number)
+    return number
+
+
+def _values(row, *keys):
+    """A multi-valued column: a JSON list or a "|"-separated string, under any of `keys`."""
+    for key in keys:
+        value = row.get(key)
+        if value:
+            values = value if isinstance(value, list) else str(value).split('|')
+            return [str(item).strip() for item in values if str(item).strip()]
+    return []
+
+
+def _store_image(field, source):
+    """Saves one image file under the ImageField's upload path. Returns its storage name."""
+    with open(source, 'rb') as image_file:
+        return field.storage.save(field.generate_filename(None, os.path.basename(source)), File(image_file))
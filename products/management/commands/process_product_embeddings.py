@@ -4,6 +4,7 @@ import json
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from products.models import Product
+from products.tasks import queue_product_embeddings
 from tqdm import tqdm
 
 
@@ -32,6 +33,12 @@ class Command(BaseCommand):
             action='store_true',
             help='Force re-processing of products that already have an embedding.'
         )
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='queue',
+            help='Queue the products as low-priority Celery batches instead of processing them here.'
+        )
 
     @transaction.atomic
     def handle(self, *args, **options):
@@ -45,17 +52,17 @@ class Command(BaseCommand):
 
         if product_id:
             try:
-                products_to_process = [Product.objects.get(productId=product_id)]
+                products_to_process = [Product.objects.with_vectors().get(productId=product_id)]
                 self.stdout.write(f"--- Processing single product: {product_id} ---")
             except Product.DoesNotExist:
                 raise CommandError(f'Product with ID "{product_id}" does not exist.')
         else:  # --all was specified
             self.stdout.write(self.style.SUCCESS("--- Processing all products with missing embeddings ---"))
 
-            products = Product.objects.filter(embedding__isnull=True)
+            products = Product.objects.with_vectors().filter(embedding__isnull=True)
             if force:
                 self.stdout.write(self.style.WARNING("--force flag detected. Processing ALL products."))
-                products = Product.objects.all()
+                products = Product.objects.with_vectors()
 
             if limit:
                 products = products[:limit]
@@ -67,6 +74,12 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS("No products to process."))
             return
 
+        if options['queue']:
+            tasks = queue_product_embeddings([product.productId for product in products_to_process], force=force or bool(product_id))
+            self.stdout.write(self.style.SUCCESS(
+                f"Queued {len(products_to_process)} products in {tasks} batch-lane tasks."))
+            return
+
         # Initialize counters for the summary
         success_count = 0
         skipped_count = 0
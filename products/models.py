@@ -1,9 +1,15 @@
 from decimal import Decimal
 
 import uuid
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Upper
 from pgvector.django import VectorField, HnswIndex, IvfflatIndex
 
+from .fieldsets import ProductFieldset
+
 
 class Category(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, name="categoryId")
@@ -24,6 +30,7 @@ class ProductSize(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, name="sizeId")
     label = models.CharField(max_length=50)  # e.g., "S", "M", "42"
     dimensions = models.CharField(max_length=100, blank=True)  # e.g., "32x34"
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         if self.dimensions:
@@ -34,6 +41,67 @@ class ProductSize(models.Model):
         ordering = ['label']
 
 
+def final_price_expression():
+    """SQL version of Product.get_final_price()."""
+    return models.ExpressionWrapper(
+        models.F('base_price') * (Value(1) - models.F('discount_percent') / Value(100)),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+class ProductQuerySet(models.QuerySet):
+    # Columns only similarity search and text search need. Read paths never
+    # load them: a 2048-float vector is ~8 KB per row that no serializer returns.
+    VECTOR_FIELDS = ('embedding', 'search_vector')
+
+    def without_vectors(self):
+        return self.defer(*self.VECTOR_FIELDS)
+
+    def with_vectors(self):
+        """Loads the vector columns too (clears every deferral on the queryset)."""
+        return self.defer(None)
+
+    def for_catalog(self, fieldset=None, also=()):
+        """
+        Read-optimized queryset for ProductSerializer: the final price is
+        computed in SQL and the nested relations are prefetched (images with
+        only the columns serialized), so a page costs the same few queries
+        whatever its size.
+
+        With a ProductFieldset (?fields= / ?expand=, see fieldsets.py) only the
+        selected columns are loaded, plus the `also` columns the caller needs
+        itself, and only the selected relations are prefetched; unexpanded
+        ones with their keys only.
+        """
+        fieldset = fieldset or ProductFieldset()
+        queryset = self
+        if fieldset.fields is not None:
+            columns = {field.name for field in self.model._meta.concrete_fields} - set(self.VECTOR_FIELDS)
+            queryset = queryset.only('pk', *(columns & (fieldset.fields | set(also))))
+
+        related = {
+            'categories': (Category.objects.all(), ['pk']),
+            'sizes': (ProductSize.objects.all(), ['pk']),
+            'images': (ProductImage.objects.only('id', 'product_id', 'image', 'alt_text', 'variants'), ['id', 'product_id']),
+        }
+        prefetches = [
+            models.Prefetch(name, queryset=expanded if fieldset.expands(name) else expanded.model.objects.only(*keys))
+            for name, (expanded, keys) in related.items()
+            if fieldset.includes(name)
+        ]
+        queryset = queryset.prefetch_related(*prefetches)
+        if fieldset.includes('final_price'):
+            queryset = queryset.annotate(final_price=final_price_expression())
+        return queryset
+
+
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    """Default manager: products are fetched without their vector columns."""
+
+    def get_queryset(self):
+        return super().get_queryset().without_vectors()
+
+
 class Product(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, name="productId")
     sku = models.CharField(max_length=100, unique=True)
@@ -44,6 +112,9 @@ class Product(models.Model):
     stock_quantity = models.IntegerField()
     embedding = VectorField(dimensions=2048, null=True, blank=True)
     gender = models.CharField(max_length=10, null=True)
+    # Weighted name (A) + description (B) tsvector, kept up to date by a database
+    # trigger (see migration 0003) and queried by ProductSearchFilter.
+    search_vector = SearchVectorField(null=True, editable=False)
 
     categories = models.ManyToManyField(Category, related_name='products')
     sizes = models.ManyToManyField(ProductSize, related_name='products')
@@ -51,6 +122,10 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Also used by related managers and prefetches (cart items, recommendation logs).
+    # The base manager (plain FK access, refresh_from_db) still loads every column.
+    objects = ProductManager()
+
     def __str__(self):
         return f"{self.name} (SKU: {self.sku})"
 
@@ -84,7 +159,14 @@ class Product(models.Model):
     #     ]
 
     class Meta:
-        indexes = []
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            # Fuzzy / partial matches on name and SKU (pg_trgm)
+            GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['sku'], name='product_sku_trgm', opclasses=['gin_trgm_ops']),
+            # SKU substrings: `sku__icontains` compiles to UPPER(sku) LIKE UPPER('%...%')
+            GinIndex(OpClass(Upper('sku'), name='gin_trgm_ops'), name='product_sku_upper_trgm'),
+        ]
 
 
 class ProductImage(models.Model):
@@ -92,7 +174,22 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
     alt_text = models.CharField(max_length=255, blank=True)
+    # Resized WebP/JPEG copies, filled in asynchronously (see image_variants.py):
+    # {'source': <image name>, 'webp': [{'width', 'height', 'name'}, ...], 'jpeg': [...]}
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Image for {self.product.name}"
+
+    def variants_current(self):
+        """Whether the stored variants were made from the current image file."""
+        return bool(self.image) and self.variants.get('source') == self.image.name
+
+    def thumbnail_url(self, width, image_format='webp'):
+        """URL of the smallest variant at least `width` pixels wide, or of the original image."""
+        if not self.variants_current():
+            return self.image.url if self.image else None
+        candidates = self.variants.get(image_format) or []
+        variant = next((v for v in candidates if v['width'] >= width), candidates[-1] if candidates else None)
+        return self.image.storage.url(variant['name']) if variant else self.image.url
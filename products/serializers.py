@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from . import image_variants
+from .fieldsets import ProductFieldset, RELATIONS
 from .models import Category, ProductSize, Product, ProductImage
 
 
@@ -15,9 +17,16 @@ class ProductSizeSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    # Resized WebP/JPEG variants as {MIME type: srcset}, empty until they are generated
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text']
+        fields = ['id', 'image', 'alt_text', 'srcset']
+
+    def get_srcset(self, obj):
+        request = self.context.get('request')
+        return image_variants.srcset(obj, request.build_absolute_uri if request is not None else str)
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -45,8 +54,28 @@ class ProductSerializer(serializers.ModelSerializer):
             'categories_ids', 'sizes_ids', 'images'
         ]
 
+    def get_fields(self):
+        """
+        Applies ?fields= and ?expand= (see fieldsets.py). Views may pass the
+        selection as context['product_fieldset'], otherwise it is read from the request.
+        """
+        fields = super().get_fields()
+        fieldset = self.context.get('product_fieldset') or ProductFieldset.from_request(self.context.get('request'))
+        for name, field in list(fields.items()):
+            if field.write_only:
+                continue
+            if not fieldset.includes(name):
+                del fields[name]
+            elif name in RELATIONS and not fieldset.expands(name):
+                fields[name] = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+        return fields
+
     def get_final_price(self, obj):
-        return obj.get_final_price()
+        # Annotated in SQL by Product.objects.for_catalog()
+        final_price = getattr(obj, 'final_price', None)
+        if final_price is None:
+            return obj.get_final_price()
+        return final_price
 
 
 class ProductMiniSerializer(serializers.ModelSerializer):
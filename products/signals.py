@@ -1,10 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 from django.db import transaction
+from django.utils import timezone
 import subprocess
 import os
 import json
-from .models import Product, ProductImage
+from fashionRecommendationSystem import response_cache
+from .models import Product, ProductImage, Category, ProductSize, ProductQuerySet
+from .tasks import queue_image_variants
 
 
 @receiver(post_save, sender=Product)
@@ -92,4 +95,75 @@ def update_product_embedding_on_image_change(sender, instance, created, **kwargs
                 instance.product.save(update_fields=['embedding'])
                 print(f"Generated embedding for product: {instance.product.name} using new image")
         except Exception as e:
-            print(f"Error generating embedding for product {instance.product.name}: {e}") 
\ No newline at end of file
+            print(f"Error generating embedding for product {instance.product.name}: {e}")
+
+
+@receiver(post_save, sender=ProductImage)
+def queue_image_variants_on_upload(sender, instance, **kwargs):
+    """Resized WebP/JPEG copies are made by a Celery task once the image is committed."""
+    if instance.image and not instance.variants_current():
+        transaction.on_commit(lambda: queue_image_variants([instance.id]))
+
+
+# --- Keep Product.updated_at current for conditional GET (ETag / Last-Modified) ---
+
+def touch_products(product_ids):
+    """Bumps updated_at without saving (or signalling) the products again."""
+    Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_product_on_image_change(sender, instance, **kwargs):
+    touch_products([instance.product_id])
+    response_cache.invalidate('products', [instance.product_id])
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Product.sizes.through)
+def touch_product_on_relation_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # Clearing a category or size sends no pk_set: touch its products while they are still linked.
+        touch_products(list(instance.products.values_list('pk', flat=True)))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    product_ids = [instance.pk] if not reverse else list(pk_set or ())
+    if product_ids:
+        touch_products(product_ids)
+        response_cache.invalidate('products', product_ids)
+    elif reverse:
+        # A category or size was cleared of all its products.
+        response_cache.invalidate_dependents('products')
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=ProductSize)
+def touch_products_on_relation_delete(sender, instance, **kwargs):
+    # The cascade through the M2M table sends no m2m_changed.
+    touch_products(list(instance.products.values_list('pk', flat=True)))
+
+
+# --- Invalidate cached anonymous catalog responses (fashionRecommendationSystem/response_cache.py) ---
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_responses(sender, instance, update_fields=None, **kwargs):
+    # Vector columns are never part of a response, so saving only them changes nothing cached.
+    if update_fields and set(update_fields) <= set(ProductQuerySet.VECTOR_FIELDS):
+        return
+    response_cache.invalidate('products', [instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_responses(sender, instance, **kwargs):
+    response_cache.invalidate('categories', [instance.pk])
+    # Categories are nested into every product response
+    response_cache.invalidate_dependents('products')
+
+
+@receiver(post_save, sender=ProductSize)
+@receiver(post_delete, sender=ProductSize)
+def invalidate_size_responses(sender, instance, **kwargs):
+    response_cache.invalidate_dependents('products')
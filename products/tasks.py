@@ -0,0 +1,91 @@
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from fashionRecommendationSystem import lanes, response_cache
+from recommendations.ai_services.style_embedding import generate_style_embeddings
+from .image_variants import build_variants
+from .models import Product, ProductImage
+
+
+@shared_task(priority=lanes.BATCH)
+def process_product_embeddings(product_ids, force=False):
+    """
+    Celery task to generate Style2Vec embeddings for a batch of catalog products
+    from their first image, with one Style2Vec run for the whole batch.
+    Runs in the batch lane, so style uploads are served first.
+    """
+    products = Product.objects.filter(productId__in=product_ids).prefetch_related('images')
+    if not force:
+        products = products.filter(embedding__isnull=True)
+
+    to_embed = []
+    for product in products:
+        images = list(product.images.all())
+        if images and images[0].image:
+            to_embed.append((product, images[0].image.path))
+        else:
+            print(f"SKIPPING: Product {product.name} (SKU: {product.sku}) has no images.")
+    if not to_embed:
+        return "No products to process."
+
+    vectors = generate_style_embeddings([path for _, path in to_embed])
+    embedded = []
+    for (product, _), vector in zip(to_embed, vectors):
+        if vector:
+            product.embedding = vector
+            embedded.append(product)
+    Product.objects.bulk_update(embedded, ['embedding'])
+
+    return f"Embeddings generated for {len(embedded)} of {len(to_embed)} products."
+
+
+def queue_product_embeddings(product_ids, force=False):
+    """
+    Splits the products into CATALOG_EMBEDDING_BATCH_SIZE batches and queues one
+    process_product_embeddings task per batch. Returns the number of tasks queued.
+    """
+    product_ids = [str(product_id) for product_id in product_ids]
+    batch_size = max(settings.CATALOG_EMBEDDING_BATCH_SIZE, 1)
+    batches = [product_ids[i:i + batch_size] for i in range(0, len(product_ids), batch_size)]
+    for batch in batches:
+        process_product_embeddings.delay(batch, force)
+    return len(batches)
+
+
+@shared_task(priority=lanes.BATCH)
+def process_image_variants(image_ids):
+    """
+    Celery task to create the resized WebP/JPEG variants of product images
+    (see image_variants.py). Images whose variants are already current are skipped.
+    """
+    images = [image for image in ProductImage.objects.filter(id__in=image_ids) if not image.variants_current()]
+    done = []
+    for image in images:
+        try:
+            image.variants = build_variants(image.image)
+        except (OSError, ValueError) as e:  # missing or unreadable file
+            print(f"Could not create variants for product image {image.id}: {e}")
+            continue
+        done.append(image)
+    # bulk_update sends no signals, so the product and cached responses are refreshed here.
+    ProductImage.objects.bulk_update(done, ['variants'])
+    product_ids = {image.product_id for image in done}
+    if product_ids:
+        Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+        response_cache.invalidate('products', product_ids)
+
+    return f"Variants created for {len(done)} of {len(images)} images."
+
+
+def queue_image_variants(image_ids):
+    """
+    Splits the images into PRODUCT_IMAGE_VARIANT_BATCH_SIZE batches and queues one
+    process_image_variants task per batch. Returns the number of tasks queued.
+    """
+    image_ids = [str(image_id) for image_id in image_ids]
+    batch_size = max(settings.PRODUCT_IMAGE_VARIANT_BATCH_SIZE, 1)
+    batches = [image_ids[i:i + batch_size] for i in range(0, len(image_ids), batch_size)]
+    for batch in batches:
+        process_image_variants.delay(batch)
+    return len(batches)
@@ -1,3 +1,441 @@
-from django.test import TestCase
+import os
+import re
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from orders.models import Cart, CartItem, Order, OrderItem
+from users.models import User
+from .image_variants import VARIANT_DIR, build_variants
+from .management.commands.import_catalog import _count_rows
+from .models import Category, Product, ProductImage, ProductQuerySet, ProductSize
+from .tasks import process_image_variants
+
+
+def create_catalog(count):
+    """`count` products, each with two categories, two sizes and an image (bulk, so no signals run)."""
+    categories = Category.objects.bulk_create([Category(name='Dress'), Category(name='Top')])
+    sizes = ProductSize.objects.bulk_create([ProductSize(label='S'), ProductSize(label='M')])
+    products = Product.objects.bulk_create([
+        Product(sku=f'SKU-{i:04d}', name=f'Product {i}', description='A product', base_price=Decimal('100.00'),
+                discount_percent=Decimal('10.00'), stock_quantity=5)
+        for i in range(count)
+    ])
+    Product.categories.through.objects.bulk_create([
+        Product.categories.through(product_id=product.pk, category_id=category.pk)
+        for product in products for category in categories
+    ])
+    Product.sizes.through.objects.bulk_create([
+        Product.sizes.through(product_id=product.pk, productsize_id=size.pk)
+        for product in products for size in sizes
+    ])
+    ProductImage.objects.bulk_create([
+        ProductImage(product=product, image=f'products/{product.sku}.jpg', alt_text=product.name)
+        for product in products
+    ])
+    return products
+
+
+def selected_columns(queries, table):
+    """
+    The columns of `table` that the SELECTs in `queries` (a CaptureQueriesContext)
+    load as they are, not those only used inside an aggregate or an expression.
+    """
+    return {
+        column
+        for query in queries.captured_queries if query['sql'].lstrip().upper().startswith('SELECT')
+        for column in re.findall(rf'(?:^SELECT |, )(?:DISTINCT )?"{table}"\."(\w+)"(?=, | FROM )', query['sql'].lstrip())
+    }
+
+
+def selected_vector_columns(queries):
+    """The Product vector columns that the SELECTs in `queries` load."""
+    return selected_columns(queries, 'products_product') & set(ProductQuerySet.VECTOR_FIELDS)
+
+
+@override_settings(RESPONSE_CACHE_SECONDS=0)
+class ProductQueryCountTests(TestCase):
+    """A page of products costs the same queries whatever its size."""
+
+    # Conditional GET stamps (products, categories, sizes), COUNT, the page,
+    # and one prefetch each for categories, sizes and images.
+    LIST_QUERIES = 8
+    # Conditional GET stamps (product, categories, sizes), the product and its three prefetches.
+    DETAIL_QUERIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_catalog(25)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        for page_size in (5, 25):
+            with self.subTest(page_size=page_size), self.assertNumQueries(self.LIST_QUERIES):
+                response = self.client.get('/api/products/', {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['data']), page_size)
+
+    def test_detail_queries(self):
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            response = self.client.get(f'/api/products/{self.products[0].pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']['categories']), 2)
+
+
+class ProductUpdateTests(TestCase):
+    def setUp(self):
+        self.product = create_catalog(1)[0]
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password123'
+        ))
+
+    def test_update_returns_the_new_final_price(self):
+        response = self.client.patch(f'/api/products/{self.product.pk}/', {'base_price': '200.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.json()['data']['final_price'])), Decimal('180.00'))
+
+
+@override_settings(RESPONSE_CACHE_SECONDS=0)
+class ProductVectorColumnTests(TestCase):
+    """Catalog reads never load the embedding or search vector columns."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_catalog(3)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list_and_detail(self):
+        for url in ('/api/products/', f'/api/products/{self.products[0].pk}/'):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(selected_vector_columns(queries), set())
+
+
+class ImportCatalogTests(TestCase):
+    CSV = (
+        'sku,name,price,discount_percent,description,categories,sizes\n'
+        'SKU-1,Linen shirt,40.00,10,"Loose fit,\nwashed linen",t-shirts|NEW ARRIVALS,s|M\n'
+        'SKU-2,Wool coat,120.00,NaN,,Coats,L\n'
+        'SKU-3,Cotton tee,15.00,,,T-SHIRTS,S\n'
+    )
+
+    def write_csv(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w', encoding='utf-8', newline='') as catalog:
+            catalog.write(self.CSV)
+        return path
+
+    def test_import(self):
+        t_shirts = Category.objects.create(name='T-Shirts')
+        ProductSize.objects.create(label='S')
+        call_command('import_catalog', self.write_csv(), '--no-embeddings', stdout=StringIO())
+
+        self.assertEqual(set(Product.objects.values_list('sku', flat=True)), {'SKU-1', 'SKU-3'})  # NaN discount skipped
+        shirt = Product.objects.get(sku='SKU-1')
+        self.assertEqual(shirt.description, 'Loose fit,\nwashed linen')
+        # Existing names are matched whatever their case and keep their spelling; new ones are stored as given.
+        self.assertEqual(set(shirt.categories.values_list('name', flat=True)), {'T-Shirts', 'NEW ARRIVALS'})
+        self.assertEqual(list(Product.objects.get(sku='SKU-3').categories.all()), [t_shirts])
+        self.assertEqual(set(Category.objects.values_list('name', flat=True)), {'T-Shirts', 'NEW ARRIVALS'})
+        self.assertEqual(set(ProductSize.objects.values_list('label', flat=True)), {'S', 'M'})
+
+    def test_progress_total_counts_records(self):
+        self.assertEqual(_count_rows(self.write_csv(), 'csv'), 3)
+
+
+@override_settings(RESPONSE_CACHE_SECONDS=300)
+class ResponseCacheTests(TestCase):
+    """Anonymous catalog reads are cached until a change they depend on commits."""
+
+    def setUp(self):
+        cache.clear()
+        self.product = create_catalog(2)[0]
+        self.client = APIClient()
+        self.list_url = '/api/products/'
+        self.detail_url = f'/api/products/{self.product.pk}/'
+
+    def get_cached(self, url, **extra):
+        """GETs `url` twice and checks the second request is answered from the cache."""
+        first = self.client.get(url, **extra)
+        with self.assertNumQueries(0):
+            second = self.client.get(url, **extra)
+        self.assertEqual(second.content, first.content)
+        return first
+
+    def assertServedFresh(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertTrue(queries.captured_queries, f'{url} was served from the cache')
+        return response.json()['data']
+
+    def test_product_edit(self):
+        upper_case_url = f'/api/products/{str(self.product.pk).upper()}/'
+        for url in (self.list_url, self.detail_url, upper_case_url):
+            self.get_cached(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed'
+            self.product.save()
+
+        self.assertIn('Renamed', [product['name'] for product in self.assertServedFresh(self.list_url)])
+        self.assertEqual(self.assertServedFresh(self.detail_url)['name'], 'Renamed')
+        self.assertEqual(self.assertServedFresh(upper_case_url)['name'], 'Renamed')
+
+    def test_invalidation_waits_for_the_commit(self):
+        original_name = self.product.name
+        self.get_cached(self.detail_url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.name = 'Renamed'
+            self.product.save()
+            # Still inside the writer's transaction: the cached body stays current.
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(self.detail_url).json()['data']['name'], original_name)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.assertServedFresh(self.detail_url)['name'], 'Renamed')
+
+    def test_category_edit(self):
+        self.get_cached(self.list_url)
+        self.get_cached('/api/categories/')
+        category = Category.objects.get(name='Dress')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category.name = 'Gown'
+            category.save()
+
+        names = {c['name'] for product in self.assertServedFresh(self.list_url) for c in product['categories']}
+        self.assertIn('Gown', names)
+        self.assertIn('Gown', [c['name'] for c in self.assertServedFresh('/api/categories/')])
+
+    def test_size_edit(self):
+        self.get_cached(self.detail_url)
+        size = ProductSize.objects.get(label='S')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            size.label = 'XS'
+            size.save()
+
+        self.assertIn('XS', [s['label'] for s in self.assertServedFresh(self.detail_url)['sizes']])
+
+    def test_admin_bulk_action(self):
+        self.get_cached(self.list_url)
+        self.get_cached(self.detail_url)
+        admin_client = Client()
+        admin_client.force_login(User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password123'
+        ))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            admin_client.post('/admin/products/product/', {
+                'action': 'mark_out_of_stock', '_selected_action': [str(self.product.pk)],
+            })
+
+        self.assertEqual(self.assertServedFresh(self.detail_url)['stock_quantity'], 0)
+        stock = {p['productId']: p['stock_quantity'] for p in self.assertServedFresh(self.list_url)}
+        self.assertEqual(stock[str(self.product.pk)], 0)
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        self.client.force_authenticate(user=User.objects.create_user(
+            username='shopper', email='shopper@example.com', password='password123'
+        ))
+        self.client.get(self.list_url)
+        self.assertServedFresh(self.list_url)
+
+        # Nor did they fill it for anonymous readers.
+        self.client.force_authenticate(user=None)
+        self.assertServedFresh(self.list_url)
+
+    def test_not_modified_from_a_cached_entry(self):
+        etag = self.get_cached(self.detail_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed'
+            self.product.save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(RESPONSE_CACHE_SECONDS=0)
+class ProductFieldsetTests(TestCase):
+    """?fields= and ?expand= shape the product representation and prune the queries behind it."""
+
+    # Conditional GET stamps (products, categories, sizes), COUNT and the page: no prefetches.
+    PRUNED_LIST_QUERIES = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_catalog(5)
+        cls.user = User.objects.create_user(username='shopper', email='shopper@example.com', password='password123')
+        cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=2) for product in cls.products[:2]])
+        order = Order.objects.create(user=cls.user)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, unit_price=Decimal('90.00')) for product in cls.products[:2]
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, url, params, queries=None):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        if queries is not None:
+            self.assertEqual(len(captured.captured_queries), queries)
+        return response.json()['data'], captured
+
+    def test_fields_prune_columns_and_relations(self):
+        data, queries = self.get('/api/products/', {'fields': 'productId,name,final_price'}, self.PRUNED_LIST_QUERIES)
+        self.assertEqual({frozenset(product) for product in data}, {frozenset({'productId', 'name', 'final_price'})})
+        self.assertEqual(data[0]['final_price'], 90.0)
+        self.assertEqual(selected_columns(queries, 'products_product'), {'productId', 'name'})
+
+    def test_unexpanded_relations_are_keys(self):
+        data, queries = self.get('/api/products/', {'expand': 'images'}, ProductQueryCountTests.LIST_QUERIES)
+        product = data[0]
+        self.assertEqual(len(product['categories']), 2)
+        self.assertTrue(all(isinstance(pk, str) for pk in product['categories'] + product['sizes']))
+        self.assertEqual(set(product['images'][0]), {'id', 'image', 'alt_text', 'srcset'})
+        # The keys-only prefetches load the primary keys alone.
+        self.assertEqual(selected_columns(queries, 'products_category'), {'categoryId'})
+        self.assertEqual(selected_columns(queries, 'products_productsize'), {'sizeId'})
+
+        data, _ = self.get('/api/products/', {'expand': ''})
+        self.assertTrue(all(isinstance(pk, str) for pk in data[0]['images']))
+
+    def test_detail(self):
+        data, _ = self.get(f'/api/products/{self.products[0].pk}/', {'fields': 'name,sizes', 'expand': 'sizes'})
+        self.assertEqual(set(data), {'name', 'sizes'})
+        self.assertEqual({size['label'] for size in data['sizes']}, {'S', 'M'})
+
+    def test_cart_keeps_prices_for_its_totals(self):
+        self.client.force_authenticate(user=self.user)
+        # The cart, its items and their products.
+        data, queries = self.get('/api/cart/', {'fields': 'name'}, 3)
+        self.assertEqual([set(item['product']) for item in data['items']], [{'name'}, {'name'}])
+        self.assertEqual(Decimal(str(data['total_price'])), Decimal('360.00'))
+        self.assertEqual(selected_columns(queries, 'products_product'),
+                         {'productId', 'name', 'base_price', 'discount_percent'})
+
+    def test_orders(self):
+        self.client.force_authenticate(user=self.user)
+        data, queries = self.get('/api/orders/', {'fields': 'productId,final_price', 'expand': ''})
+        items = data[0]['items']
+        self.assertEqual([set(item['product']) for item in items], [{'productId', 'final_price'}] * 2)
+        self.assertEqual(selected_columns(queries, 'products_product'), {'productId'})
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create([
+            Product(sku='FW24-DRS-000123-BLK-M', name='Evening dress', description='Black satin',
+                    base_price=Decimal('150.00'), stock_quantity=1),
+            Product(sku='SS25-TOP-000456-WHT-S', name='Linen top', description='White linen',
+                    base_price=Decimal('40.00'), stock_quantity=1),
+        ])
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('pg_trgm is not installed')
+        self.client = APIClient()
+
+    def test_sku_fragment(self):
+        response = self.client.get('/api/products/', {'search': '000123'})
+        self.assertEqual([product['name'] for product in response.json()['data']], ['Evening dress'])
+
+
+def jpeg_bytes(size, color):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@override_settings(PRODUCT_IMAGE_VARIANT_WIDTHS=(160, 320, 640), RESPONSE_CACHE_SECONDS=0)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.media_root = media_root
+        self.product = create_catalog(1)[0]
+
+    def add_image(self, name, data):
+        field = ProductImage._meta.get_field('image')
+        stored = field.storage.save(field.generate_filename(None, name), ContentFile(data))
+        return ProductImage.objects.bulk_create([ProductImage(product=self.product, image=stored)])[0]
+
+    def variant_files(self):
+        root = os.path.join(self.media_root, VARIANT_DIR)
+        return sorted(os.path.join(path, name) for path, _, names in os.walk(root) for name in names)
+
+    def test_no_upscaling(self):
+        image = self.add_image('small.jpg', jpeg_bytes((300, 150), 'red'))
+        variants = build_variants(image.image)
+        for key in ('webp', 'jpeg'):
+            self.assertEqual([(v['width'], v['height']) for v in variants[key]], [(160, 80), (300, 150)])
+
+    def test_identical_files_share_their_variants(self):
+        data = jpeg_bytes((400, 400), 'blue')
+        first = build_variants(self.add_image('first.jpg', data).image)
+        files = self.variant_files()
+        second = build_variants(self.add_image('second.jpg', data).image)
+
+        self.assertEqual(second['webp'], first['webp'])
+        self.assertEqual(second['jpeg'], first['jpeg'])
+        self.assertEqual(self.variant_files(), files)
+
+    def test_replaced_file_outdates_the_variants(self):
+        image = self.add_image('look.jpg', jpeg_bytes((400, 400), 'green'))
+        process_image_variants([str(image.id)])
+        image.refresh_from_db()
+        self.assertTrue(image.variants_current())
+        old_hash = image.variants['hash']
+
+        replacement = self.add_image('replacement.jpg', jpeg_bytes((400, 400), 'white'))
+        image.image = replacement.image.name
+        self.assertFalse(image.variants_current())
+        self.assertEqual(image.thumbnail_url(160), image.image.url)
+
+        ProductImage.objects.filter(pk=image.pk).update(image=image.image.name)
+        process_image_variants([str(image.id)])
+        image.refresh_from_db()
+        self.assertTrue(image.variants_current())
+        self.assertNotEqual(image.variants['hash'], old_hash)
+
+    def test_srcset_is_empty_until_the_variants_exist(self):
+        image = self.add_image('look.jpg', jpeg_bytes((400, 400), 'black'))
+        url = f'/api/products/{self.product.pk}/'
+        images = {i['id']: i for i in APIClient().get(url).json()['data']['images']}
+        self.assertEqual(images[str(image.id)]['srcset'], {})
+        self.assertTrue(images[str(image.id)]['image'].endswith(image.image.name))
+
+        process_image_variants([str(image.id)])
+        images = {i['id']: i for i in APIClient().get(url).json()['data']['images']}
+        self.assertEqual(list(images[str(image.id)]['srcset']), ['image/webp', 'image/jpeg'])
+        self.assertIn(' 320w', images[str(image.id)]['srcset']['image/webp'])
@@ -2,22 +2,36 @@ from rest_framework import viewsets, permissions, filters
 from .models import Product, Category, ProductSize, ProductImage
 from .serializers import ProductSerializer, CategorySerializer, ProductSizeSerializer, ProductImageSerializer
 from rest_framework.parsers import MultiPartParser, FormParser
-from .filters import ProductFilter
+from .filters import ProductFilter, ProductSearchFilter
+from .fieldsets import ProductFieldset
 from django_filters.rest_framework import DjangoFilterBackend
+from fashionRecommendationSystem.conditional import ConditionalGetMixin
+from fashionRecommendationSystem.response_cache import CachedResponseMixin
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """API endpoint for products."""
-    queryset = Product.objects.all().prefetch_related('categories', 'sizes')
+    queryset = Product.objects.for_catalog()
+    response_cache_scope = 'products'
+    # Image and category/size assignment changes touch Product.updated_at (see signals.py)
+    conditional_dependencies = (Category, ProductSize)
     serializer_class = ProductSerializer
     filterset_class = ProductFilter
 
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['productId', 'name', 'sku', 'description']
+    # ProductSearchFilter comes last: without ?ordering= it orders by search rank.
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ProductSearchFilter]
 
     ordering_fields = ['name', 'base_price', 'created_at']
     ordering = ['-created_at']
 
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            # ?fields= / ?expand= prune the columns and prefetches as well as the output
+            return Product.objects.for_catalog(ProductFieldset.from_request(self.request))
+        # Writes serialize the instance they changed: a final_price annotated
+        # before the write would return the old price.
+        return Product.objects.all()
+
     def get_permissions(self):
         # Allow anyone to view products (list, retrieve)
         if self.action in ['list', 'retrieve']:
@@ -28,14 +42,15 @@ class ProductViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoint for viewing categories."""
+    response_cache_scope = 'categories'
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
 
 
-class ProductSizeViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductSizeViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoint for viewing product sizes."""
     queryset = ProductSize.objects.all()
     serializer_class = ProductSizeSerializer
@@ -1,6 +1,9 @@
+from PIL import Image
 from ultralytics import FastSAM
+import clip
 import cv2
 import numpy as np
+import torch
 
 # Map simple categories to more descriptive prompts
 PROMPT_MAP = {
@@ -22,6 +25,15 @@ PROMPT_MAP = {
     'default': ''
 }
 
+CLIP_MODEL_NAME = "ViT-B/32"
+
+# Mask proposals smaller than this many pixels are noise, not garments.
+MIN_MASK_AREA = 100
+
+# CLIP cosine similarity a mask needs with a category's prompt to be kept for it.
+# Unrelated text/image pairs score around 0.15 with ViT-B/32, matching ones 0.25 and up.
+MIN_PROMPT_SIMILARITY = 0.2
+
 # match prompt_category:
 #     case 'top':
 #         prompt_category = 'top or t-shirt'
@@ -57,68 +69,104 @@ PROMPT_MAP = {
 #         prompt_category = prompt_category
 
 
+def assign_masks(similarity, min_similarity=MIN_PROMPT_SIMILARITY):
+    """
+    Matches categories to mask proposals from their (categories x masks) CLIP
+    similarity: best pairs first, each mask given to one category at most, and
+    only pairs reaching `min_similarity`. Returns {category index: mask index}.
+    """
+    similarity = np.asarray(similarity)
+    assigned, used = {}, set()
+    for flat in np.argsort(similarity, axis=None)[::-1]:
+        category, mask = np.unravel_index(flat, similarity.shape)
+        if similarity[category, mask] < min_similarity:
+            break
+        if category not in assigned and mask not in used:
+            assigned[int(category)] = int(mask)
+            used.add(mask)
+    return assigned
+
+
 class FastSAMSegmenter:
     def __init__(self):
         # It's better to initialize the model once.
         self.model = FastSAM("./ai_models/FastSAM-x.pt")
-
-    def segment_object(self, image_path, category_name):
-        """
-        Final robust version with added print statements for debugging shape mismatches.
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.clip_model, self.clip_preprocess = clip.load(CLIP_MODEL_NAME, device=self.device)
+
+        # PROMPT_MAP never changes, so its text embeddings are encoded once here.
+        self.prompt_embeddings = {}
+        self._encode_prompts([category for category, prompt in PROMPT_MAP.items() if prompt])
+
+    def _encode_prompts(self, categories):
+        """Encodes and caches the CLIP text embedding of every category not cached yet."""
+        missing = [category for category in categories if category not in self.prompt_embeddings]
+        if not missing:
+            return
+        tokens = clip.tokenize([PROMPT_MAP.get(category) or category for category in missing]).to(self.device)
+        with torch.inference_mode():
+            features = self.clip_model.encode_text(tokens)
+            features /= features.norm(dim=-1, keepdim=True)
+        self.prompt_embeddings.update(zip(missing, features))
+
+    def segment_objects(self, image, categories):
         """
-        source = cv2.imread(image_path)
-        if source is None:
-            print(f"[DEBUG] Error: Could not read image from path: {image_path}")
-            return None
+        Segments every category in one pass: the image is read and run through
+        FastSAM once, and all prompts are scored against the same mask proposals.
 
-        prompt = PROMPT_MAP.get(category_name, category_name)
+        Takes an image path (or a BGR array) and returns a dictionary of:
+        { 'category_name': <BGR cutout cropped to the mask, on a white background> }
+        Each mask goes to at most one category (the best scoring), and
+        categories with no mask reaching MIN_PROMPT_SIMILARITY are left out.
+        """
+        if not categories:
+            return {}
 
-        # --- Run Inference ---
-        print(f"[DEBUG] Running FastSAM for prompt: '{prompt}' on image with shape: {source.shape}")
-        results = self.model(source, texts=prompt)
+        source = image if isinstance(image, np.ndarray) else cv2.imread(image)
+        if source is None:
+            print(f"Error: Could not read image from path: {image}")
+            return {}
 
+        results = self.model(source, retina_masks=True, verbose=False)
         if results[0].masks is None or len(results[0].masks.data) == 0:
-            print(f"[DEBUG] FastSAM found no masks for prompt '{prompt}'")
-            return None
+            return {}
 
-        # --- Process Mask ---
-        mask = results[0].masks.data[0].cpu().numpy()
-        print(f"[DEBUG] Initial mask shape from model: {mask.shape}")
+        masks = results[0].masks.data.cpu().numpy() > 0
+        mask_h, mask_w = masks.shape[1:]
 
-        # Let's get the height and width the model *actually* used for its output mask
-        mask_h, mask_w = mask.shape[:2]
-
-        # --- Prepare source image ---
-        # The source image must be resized to match the mask dimensions for the cutout
-        # Let's use the dimensions of the returned mask as the source of truth.
+        # The mask dimensions are the source of truth for the cutouts.
         source_rgb = cv2.cvtColor(source, cv2.COLOR_BGR2RGB)
-
         if source_rgb.shape[:2] != (mask_h, mask_w):
-            print(f"[DEBUG] Resizing source image from {source_rgb.shape[:2]} to match mask {(mask_h, mask_w)}")
             source_rgb = cv2.resize(source_rgb, (mask_w, mask_h))
 
-        white_bg = np.ones_like(source_rgb) * 255
-
-        # --- Final Shape Check Before Crashing Line ---
-        mask_3d = mask.astype(np.uint8)[..., np.newaxis]
-
-        print("-------------------- FINAL SHAPE CHECK --------------------")
-        print(f"[DEBUG] Shape of mask_3d (condition):      {mask_3d.shape}")
-        print(f"[DEBUG] Shape of source_rgb (choice 1):    {source_rgb.shape}")
-        print(f"[DEBUG] Shape of white_bg (choice 2):      {white_bg.shape}")
-        print("---------------------------------------------------------")
-
-        # This is the line that fails
-        cutout = np.where(mask_3d > 0, source_rgb, white_bg)
-
-        # --- Crop to Bounding Box ---
-        ys, xs = np.where(mask > 0)
+        # --- Cut out every proposal once, cropped to its bounding box ---
+        cutouts = []
+        for mask in masks:
+            ys, xs = np.nonzero(mask)
+            if len(xs) < MIN_MASK_AREA:
+                continue
+            y_min, y_max, x_min, x_max = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+            region = source_rgb[y_min:y_max, x_min:x_max]
+            cutouts.append(np.where(mask[y_min:y_max, x_min:x_max, np.newaxis], region, 255).astype(np.uint8))
+        if not cutouts:
+            return {}
+
+        # --- Score all prompts against all proposals with a single CLIP pass ---
+        self._encode_prompts(categories)
+        crops = torch.stack([self.clip_preprocess(Image.fromarray(cutout)) for cutout in cutouts]).to(self.device)
+        with torch.inference_mode():
+            image_features = self.clip_model.encode_image(crops)
+            image_features /= image_features.norm(dim=-1, keepdim=True)
+            text_features = torch.stack([self.prompt_embeddings[category] for category in categories])
+            similarity = (text_features @ image_features.T).float().cpu().numpy()
+
+        return {
+            categories[category]: cv2.cvtColor(cutouts[mask], cv2.COLOR_RGB2BGR)
+            for category, mask in assign_masks(similarity).items()
+        }
 
-        if len(xs) > 0 and len(ys) > 0:
-            x_min, x_max = xs.min(), xs.max()
-            y_min, y_max = ys.min(), ys.max()
-
-            cropped_cutout = cutout[y_min:y_max + 1, x_min:x_max + 1]
-            return cv2.cvtColor(cropped_cutout, cv2.COLOR_RGB2BGR)
-
-        return None
+    def segment_object(self, image_path, category_name):
+        """
+        Single-category form of segment_objects(); returns the BGR cutout or None.
+        """
+        return self.segment_objects(image_path, [category_name]).get(category_name)
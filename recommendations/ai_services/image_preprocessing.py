@@ -0,0 +1,73 @@
+import numpy as np
+from PIL import Image, ImageOps, ExifTags
+
+
+def load_capped_image(image_path, max_side=None):
+    """
+    Opens an uploaded image with its EXIF orientation applied and its long side
+    capped at `max_side` pixels, so decoding and every later per-pixel step cost
+    the same no matter what resolution the client uploaded.
+
+    Returns (PIL RGB image, modified) where `modified` tells whether the pixels
+    differ from the stored file (rotated or downsized).
+    """
+    image = Image.open(image_path)
+    original_size = image.size
+    orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+
+    if max_side:
+        # JPEG only: let libjpeg decode straight to the nearest 1/2, 1/4 or 1/8 scale.
+        image.draft('RGB', (max_side, max_side))
+
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+    modified = orientation != 1 or image.size != original_size
+    return image, modified
+
+
+def expand_box(box, size, margin):
+    """
+    Grows a (left, top, right, bottom) box by `margin` of its own size on every
+    side, clamped to an image of `size` (width, height).
+    """
+    left, top, right, bottom = box
+    pad_x = int((right - left) * margin)
+    pad_y = int((bottom - top) * margin)
+    width, height = size
+    return (
+        max(0, left - pad_x),
+        max(0, top - pad_y),
+        min(width, right + pad_x),
+        min(height, bottom + pad_y),
+    )
+
+
+def scale_box(box, from_size, to_size):
+    """
+    Maps a (left, top, right, bottom) box on a grid of `from_size` (width, height)
+    onto one of `to_size`, to the nearest pixel but at least one pixel wide and
+    high: a one-cell box on an image smaller than the grid would round to nothing.
+    """
+    def scale_axis(start, end, from_length, to_length):
+        start = min(round(start * to_length / from_length), to_length - 1)
+        return start, min(max(round(end * to_length / from_length), start + 1), to_length)
+
+    (from_width, from_height), (to_width, to_height) = from_size, to_size
+    left, right = scale_axis(box[0], box[2], from_width, to_width)
+    top, bottom = scale_axis(box[1], box[3], from_height, to_height)
+    return left, top, right, bottom
+
+
+# Style2Vec input size (see style2vec_singleton.py).
+STYLE2VEC_INPUT_SIZE = (299, 299)
+
+
+def to_style2vec_input(image):
+    """
+    The uint8 (299, 299, 3) RGB array Style2Vec would get from keras' load_img
+    on the saved segment PNG: alpha dropped, then a nearest-neighbour resize.
+    """
+    return np.asarray(image.convert('RGB').resize(STYLE2VEC_INPUT_SIZE, Image.Resampling.NEAREST), dtype=np.uint8)
@@ -15,62 +15,90 @@ CATEGORY_NAMES = (
     'skin', 'face'
 )
 
+# Body-part categories; detecting only these means there is nothing to segment.
+NON_GARMENT_CATEGORIES = {'hair', 'skin', 'face'}
+
+# Constants from your script
+THRESHOLD = 0.6
+RESIZE_RANGE = (750, 1101)
+NORM_MEAN = np.array([123.675, 116.28, 103.53], dtype=np.float32)
+NORM_STD = np.array([58.395, 57.12, 57.375], dtype=np.float32)
+
+# Padded (height, width) input shapes. Every resized image fits one of them, so the
+# net is only reshaped when the bucket changes instead of on every image.
+SHAPE_BUCKETS = ((768, 768), (768, 1120), (1120, 768))
 
-# ... (All your preprocess, post_processing, etc., functions go here)
-# ... but we will refactor recognize_from_image to be a class method.
 
 class MMFashionDetector:
     def __init__(self):
         # check_and_download_models(WEIGHT_PATH, MODEL_PATH, REMOTE_PATH)
         self.detector = ailia.Net(MODEL_PATH, WEIGHT_PATH)
         self.category_names = CATEGORY_NAMES
+        self.input_shape = None
+        self.std_inv = 1 / NORM_STD
+
+    def detect_categories(self, image):
+        """
+        Takes an image path (or an RGB array) and returns a list of detected category names.
+        """
+        return self.detect_categories_batch([image])[0]
 
-    def detect_categories(self, image_path):
+    def detect_categories_batch(self, images):
         """
-        Takes an image path and returns a list of detected category names.
+        Detects categories for several images (paths or RGB arrays). Images are
+        run grouped by shape bucket, so the net is reshaped at most once per bucket.
+        Returns one list of category names per image, in input order.
         """
-        img = cv2.imread(image_path)
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        inputs = [self._preprocess(self._read(image)) for image in images]
+        detected = [[] for _ in images]
 
-        # This function combines your old detect_objects and part of recognize_from_image
-        data = self._preprocess(img)
-        self.detector.set_input_shape((1, 3, data['img'].shape[2], data['img'].shape[3]))
-        output = self.detector.predict({'image': data['img']})
-        boxes, labels, masks = output
+        for index in sorted(range(len(inputs)), key=lambda i: inputs[i].shape):
+            data = inputs[index]
+            if data.shape != self.input_shape:
+                self.detector.set_input_shape(data.shape)
+                self.input_shape = data.shape
 
-        # Simplified post-processing to just get category names
-        detected_category_indices = set(labels[boxes[:, -1] > THRESHOLD])
-        detected_categories = [self.category_names[i] for i in detected_category_indices]
+            boxes, labels, masks = self.detector.predict({'image': data})
+            # Simplified post-processing to just get category names
+            detected_category_indices = set(labels[boxes[:, -1] > THRESHOLD].tolist())
+            detected[index] = [self.category_names[i] for i in sorted(detected_category_indices)]
 
-        return detected_categories
+        return detected
+
+    @staticmethod
+    def garment_categories(categories):
+        """The detected categories that are worth segmenting."""
+        return [category for category in categories if category not in NON_GARMENT_CATEGORIES]
+
+    @staticmethod
+    def _read(image):
+        if isinstance(image, np.ndarray):
+            return image
+        img = cv2.imread(image)
+        if img is None:
+            raise ValueError(f"Could not read image from path: {image}")
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
     def _preprocess(self, img):
-        # Your exact preprocess function from the script
         h, w = img.shape[:2]
-        max_long_edge = max(RESIZE_RANGE)
-        max_short_edge = min(RESIZE_RANGE)
-        scale_factor = min(max_long_edge / max(h, w), max_short_edge / min(h, w))
-        new_w = int(w * float(scale_factor) + 0.5)
-        new_h = int(h * float(scale_factor) + 0.5)
+        scale_factor = min(max(RESIZE_RANGE) / max(h, w), min(RESIZE_RANGE) / min(h, w))
+        new_w = int(w * scale_factor + 0.5)
+        new_h = int(h * scale_factor + 0.5)
         img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-        img = img.astype(np.float32)
-        mean = np.array(NORM_MEAN)
-        std = np.array(NORM_STD)
-        mean = np.float64(mean.reshape(1, -1))
-        stdinv = 1 / np.float64(std.reshape(1, -1))
-        cv2.subtract(img, mean, img)
-        cv2.multiply(img, stdinv, img)
-        divisor = 32
-        pad_h = int(np.ceil(img.shape[0] / divisor)) * divisor
-        pad_w = int(np.ceil(img.shape[1] / divisor)) * divisor
-        img = cv2.copyMakeBorder(img, 0, pad_h - img.shape[0], 0, pad_w - img.shape[1], cv2.BORDER_CONSTANT, value=0)
-        img = img.transpose(2, 0, 1)
-        img = np.expand_dims(img, 0)
-        return {'img': img}
 
+        # Normalize in float32 and write straight into the zero-padded bucket.
+        bucket_h, bucket_w = self._bucket(new_h, new_w)
+        data = np.zeros((1, 3, bucket_h, bucket_w), dtype=np.float32)
+        normalized = (img.astype(np.float32) - NORM_MEAN) * self.std_inv
+        data[0, :, :new_h, :new_w] = normalized.transpose(2, 0, 1)
+        return data
 
-# Constants from your script
-THRESHOLD = 0.6
-RESIZE_RANGE = (750, 1101)
-NORM_MEAN = [123.675, 116.28, 103.53]
-NORM_STD = [58.395, 57.12, 57.375]
\ No newline at end of file
+    @staticmethod
+    def _bucket(height, width):
+        """Smallest shape bucket the resized image fits in."""
+        fitting = [(bh, bw) for bh, bw in SHAPE_BUCKETS if height <= bh and width <= bw]
+        if fitting:
+            return min(fitting, key=lambda shape: shape[0] * shape[1])
+        # Not reachable with RESIZE_RANGE, kept for safety: pad to a multiple of 32.
+        divisor = 32
+        return int(np.ceil(height / divisor)) * divisor, int(np.ceil(width / divisor)) * divisor
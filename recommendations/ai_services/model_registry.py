@@ -0,0 +1,124 @@
+"""
+Lazy access to the heavy AI models.
+
+Nothing in this module imports torch, transformers or TensorFlow at import time.
+Django web processes, management commands and tests import the task modules
+without ever paying for a model; Celery workers build each model on first use
+or up front through warm_up_models() (see fashionRecommendationSystem/celery.py).
+
+Memory model of a prefork worker
+--------------------------------
+With PRELOAD_AI_MODELS the Celery parent loads SegFormer once, before the pool
+forks. Every child then sees the same physical weight pages through
+copy-on-write, so `celery inspect model_memory` shows a large `shared` and a
+small `uss` (memory unique to the child) per child, and the total cost of N
+children is roughly one model plus N * uss instead of N models. Without
+preloading, or for a runtime that cannot be shared across fork() (onnxruntime,
+CUDA), every child loads its own copy and `uss` approaches `rss`.
+
+Style2Vec is not part of this: it runs in its own interpreter (style2vec_env)
+for each embedding call, so worker processes never hold its weights.
+"""
+import gc
+import os
+import sys
+import threading
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_fast_sam_segmenter = None
+_detector = None
+
+
+def get_segmenter():
+    """Returns the process-wide SegFormerSegmenter, loading it on first call."""
+    with _lock:
+        from .segformer_segmenter import SegFormerSegmenter
+        return SegFormerSegmenter()
+
+
+def get_fast_sam_segmenter():
+    """Returns the process-wide FastSAMSegmenter, loading FastSAM and CLIP on first call."""
+    global _fast_sam_segmenter
+    with _lock:
+        if _fast_sam_segmenter is None:
+            from .fast_sam_segmenter import FastSAMSegmenter
+            _fast_sam_segmenter = FastSAMSegmenter()
+        return _fast_sam_segmenter
+
+
+def get_detector():
+    """Returns the process-wide MMFashionDetector, loading it on first call."""
+    global _detector
+    with _lock:
+        if _detector is None:
+            from .mmfashion_detector import MMFashionDetector
+            _detector = MMFashionDetector()
+        return _detector
+
+
+def warm_up_models():
+    """Loads every model a worker process needs before it accepts tasks."""
+    get_segmenter()
+    if settings.SEGMENTATION_DETECTOR_GATE:
+        get_detector()
+
+
+def preload_models():
+    """
+    Loads the models in the Celery parent process, before the pool forks, and
+    freezes them so the children share the weight pages instead of copying them.
+    Returns False when the configured runtime cannot be shared across fork().
+    """
+    from .segformer_segmenter import RUNTIMES
+
+    if not RUNTIMES[settings.SEGFORMER_RUNTIME].can_preload():
+        print(f"SegFormer '{settings.SEGFORMER_RUNTIME}' runtime cannot be shared across fork(); "
+              f"each worker process will load its own copy.")
+        return False
+
+    get_segmenter().runtime.freeze()
+
+    # Move everything allocated so far out of the collector's reach: otherwise
+    # the children's GC passes would write to (and so copy) the shared pages.
+    gc.collect()
+    gc.freeze()
+    return True
+
+
+def configure_child_process():
+    """
+    Re-applies per-process runtime settings in a freshly forked worker child.
+    """
+    if 'torch' in sys.modules and settings.SEGFORMER_NUM_THREADS:
+        sys.modules['torch'].set_num_threads(settings.SEGFORMER_NUM_THREADS)
+
+
+def memory_report():
+    """
+    Per-process memory of this worker: the parent plus every pool child.
+    `rss` is resident memory, `shared` the part backed by pages shared with
+    other processes, and `uss`/`pss` (Linux only) the memory unique to the
+    process and its proportional share of shared pages.
+    """
+    import psutil
+
+    parent = psutil.Process(os.getpid())
+    report = []
+    for process in [parent] + parent.children():
+        try:
+            info = process.memory_full_info()
+        except psutil.AccessDenied:
+            info = process.memory_info()
+        except psutil.NoSuchProcess:
+            continue
+        report.append({
+            'pid': process.pid,
+            'role': 'parent' if process.pid == parent.pid else 'child',
+            'rss_mb': round(info.rss / 2 ** 20, 1),
+            'shared_mb': round(getattr(info, 'shared', 0) / 2 ** 20, 1),
+            'uss_mb': round(info.uss / 2 ** 20, 1) if hasattr(info, 'uss') else None,
+            'pss_mb': round(info.pss / 2 ** 20, 1) if hasattr(info, 'pss') else None,
+        })
+    return report
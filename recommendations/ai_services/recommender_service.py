@@ -56,6 +56,52 @@ def get_recommendations(user_segment_id, top_n=10, gender=None):
     return list(recommended_products)
 
 
+def get_recommendations_for_segments(user_segment_ids, top_n=10, gender=None):
+    """
+    Runs get_recommendations' similarity search for several segments of the same
+    style image and logs all of them with one RecommendationLog update.
+    Returns {segment_id: [products]}.
+    """
+    embeddings = list(
+        StyleEmbedding.objects
+        .select_related('segment__style_image__user', 'segment__category_type')
+        .filter(segment__segmentId__in=user_segment_ids)
+    )
+    if not embeddings:
+        print(f"❌ No StyleEmbedding found for segments {user_segment_ids}")
+        return {}
+
+    recommendations = {}
+    for embedding_obj in embeddings:
+        base_qs = Product.objects.filter(
+            embedding__isnull=False,
+            categories=embedding_obj.segment.category_type
+        )
+        if gender:
+            base_qs = base_qs.filter(Q(gender__iexact=gender) | Q(gender__isnull=True) | Q(gender="Unisex"))
+
+        recommendations[str(embedding_obj.segment.segmentId)] = list(
+            base_qs.annotate(
+                distance=CosineDistance('embedding', embedding_obj.embeddings)
+            ).order_by('distance')[:top_n]
+        )
+
+    user_style_image = embeddings[0].segment.style_image
+    user = user_style_image.user
+    products = {product.pk: product for found in recommendations.values() for product in found}
+    if user is not None:
+        with transaction.atomic():
+            recommendation_log, _ = RecommendationLog.objects.get_or_create(
+                user=user,
+                style_image=user_style_image
+            )
+            recommendation_log.recommended_products.add(*products.values())
+        print(f"✅ Recommendations logged for user: {user.username}")
+    print(f"📊 Found {len(products)} recommendations for {len(recommendations)} segments")
+
+    return recommendations
+
+
 def get_recommendations_by_embedding(user_embedding, top_n=10):
     """
     Finds the top N most similar products directly from a given embedding vector
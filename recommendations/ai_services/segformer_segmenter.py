@@ -1,78 +1,257 @@
+import os
+
 from PIL import Image
+from django.conf import settings
 from transformers import SegformerImageProcessor, AutoModelForSemanticSegmentation, logging
 import torch
 import numpy as np
 
+from .image_preprocessing import expand_box, scale_box
+
 logging.set_verbosity_error()
 
+MODEL_NAME = "mattmdjaga/segformer_b2_clothes"
+
+# Extra context kept around the person region, as a fraction of its size.
+PERSON_BOX_MARGIN = 0.05
+
+
+class TorchRuntime:
+    """
+    Eager PyTorch inference under `inference_mode` with an explicit thread budget.
+    """
+    name = 'torch'
+
+    def __init__(self, model, num_threads=None):
+        if num_threads:
+            # Celery prefork children would otherwise each spin up one thread per core.
+            torch.set_num_threads(num_threads)
+        self.device = self.select_device()
+        self.model = self.prepare(model).to(self.device).eval()
+
+    def select_device(self):
+        return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    def prepare(self, model):
+        return model
+
+    @classmethod
+    def can_preload(cls):
+        """
+        Whether the model can be loaded in the Celery parent and shared with the
+        forked children. A CUDA context does not survive fork().
+        """
+        return not torch.cuda.is_available()
+
+    def freeze(self):
+        # Weights are never written after loading, so copy-on-write pages stay shared.
+        self.model.requires_grad_(False)
+
+    def predict_logits(self, pixel_values):
+        with torch.inference_mode():
+            return self.model(pixel_values=pixel_values.to(self.device)).logits.cpu()
+
+
+class QuantizedRuntime(TorchRuntime):
+    """
+    Eager PyTorch on CPU with the Linear layers dynamically quantized to int8.
+    """
+    name = 'quantized'
+
+    def select_device(self):
+        # Dynamic quantization kernels only exist for CPU.
+        return torch.device("cpu")
+
+    @classmethod
+    def can_preload(cls):
+        return True
+
+    def prepare(self, model):
+        return torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Wraps the HF model so the exported graph has a single tensor output."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).logits
+
+
+class OnnxRuntime:
+    """
+    Exported ONNX graph executed on onnxruntime. The graph is exported once to
+    SEGFORMER_ONNX_PATH and reused on every later start.
+    """
+    name = 'onnx'
+
+    def __init__(self, model, num_threads=None):
+        import onnxruntime as ort
+
+        onnx_path = settings.SEGFORMER_ONNX_PATH
+        if not os.path.exists(onnx_path):
+            self.export(model, onnx_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(onnx_path, options, providers=ort.get_available_providers())
+
+    @classmethod
+    def can_preload(cls):
+        # onnxruntime starts its thread pools with the session; they do not survive fork().
+        return False
+
+    def freeze(self):
+        pass
+
+    @staticmethod
+    def export(model, onnx_path):
+        print(f"Exporting SegFormer to ONNX at {onnx_path}...")
+        os.makedirs(os.path.dirname(onnx_path) or '.', exist_ok=True)
+        # The processor always resizes to 512x512, only the batch axis is dynamic.
+        dummy = torch.zeros(1, 3, 512, 512)
+        torch.onnx.export(
+            _LogitsOnly(model.eval()),
+            (dummy,),
+            onnx_path,
+            input_names=['pixel_values'],
+            output_names=['logits'],
+            dynamic_axes={'pixel_values': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=17,
+        )
+
+    def predict_logits(self, pixel_values):
+        outputs = self.session.run(['logits'], {'pixel_values': pixel_values.cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+RUNTIMES = {
+    TorchRuntime.name: TorchRuntime,
+    QuantizedRuntime.name: QuantizedRuntime,
+    OnnxRuntime.name: OnnxRuntime,
+}
+
 
 class SegFormerSegmenter:
     """
     A singleton service to handle clothing segmentation using a SegFormer model.
+    One instance is kept per runtime ('torch', 'quantized' or 'onnx'); the default
+    runtime comes from the SEGFORMER_RUNTIME setting.
     """
-    _instance = None
+    _instances = {}
 
     # This makes it a singleton - the model is only loaded into memory once.
-    def __new__(cls):
-        if cls._instance is None:
-            print("Initializing SegFormer model for the first time...")
-            cls._instance = super(SegFormerSegmenter, cls).__new__(cls)
+    def __new__(cls, runtime=None):
+        runtime = runtime or getattr(settings, 'SEGFORMER_RUNTIME', TorchRuntime.name)
+        if runtime not in RUNTIMES:
+            raise ValueError(f"Unknown SegFormer runtime '{runtime}'. Choose one of: {', '.join(RUNTIMES)}")
+
+        if runtime not in cls._instances:
+            print(f"Initializing SegFormer model ({runtime} runtime) for the first time...")
+            instance = super(SegFormerSegmenter, cls).__new__(cls)
 
             # --- Model Initialization ---
-            cls._instance.model_name = "mattmdjaga/segformer_b2_clothes"
-            cls._instance.processor = SegformerImageProcessor.from_pretrained(cls._instance.model_name)
-            cls._instance.model = AutoModelForSemanticSegmentation.from_pretrained(cls._instance.model_name)
-            cls._instance.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            cls._instance.model.to(cls._instance.device).eval()
-            print(f"SegFormer model loaded onto device: {cls._instance.device}")
+            instance.model_name = MODEL_NAME
+            instance.processor = SegformerImageProcessor.from_pretrained(instance.model_name)
+            model = AutoModelForSemanticSegmentation.from_pretrained(instance.model_name)
+            num_threads = getattr(settings, 'SEGFORMER_NUM_THREADS', None)
+            instance.runtime = RUNTIMES[runtime](model, num_threads=num_threads)
+            print(f"SegFormer model loaded with the {runtime} runtime")
 
             # --- Category Mapping and Exclusion Logic ---
-            id2label = cls._instance.model.config.id2label
-            cls._instance.categories_to_drop = {
+            id2label = model.config.id2label
+            instance.categories_to_drop = {
                 'Background', 'Hair', 'Face', 'Left-leg',
                 'Right-leg', 'Left-arm', 'Right-arm'
             }
-            cls._instance.label_map = {}
+            instance.label_map = {}
+            instance.background_id = 0
             for lbl_id, lbl_name in id2label.items():
+                if lbl_name == 'Background':
+                    instance.background_id = int(lbl_id)
+
                 # ⇢ Normalise both shoe labels to one category
                 if lbl_name in {'Right-shoe', 'Left-shoe'}:
                     final_category_name = 'footwear'
-                elif lbl_name in cls._instance.categories_to_drop:
+                elif lbl_name in instance.categories_to_drop:
                     continue
                 else:
                     final_category_name = lbl_name.lower().replace('-', ' ')
 
                 # keep only the *first* shoe we meet, ignore the duplicate
-                cls._instance.label_map.setdefault(final_category_name, int(lbl_id))
+                instance.label_map.setdefault(final_category_name, int(lbl_id))
 
-        return cls._instance
+            cls._instances[runtime] = instance
 
-    def run_segmentation(self, image_path):
+        return cls._instances[runtime]
+
+    def predict_mask(self, image, crop_to_person=False):
         """
-        Takes the path to an image and returns a dictionary of:
-        { 'category_name': <PIL.Image object of the RGBA segment> }
+        Returns the (height, width) array of label ids for a PIL RGB image.
         """
-        try:
-            image = Image.open(image_path).convert("RGB")
-        except Exception as e:
-            print(f"Error opening image {image_path}: {e}")
-            return {}
+        box_mask, (left, top, right, bottom) = self.predict_box_mask(image, crop_to_person)
+        width, height = image.size
+        prediction_mask = np.full((height, width), self.background_id, dtype=box_mask.dtype)
+        prediction_mask[top:bottom, left:right] = box_mask
+        return prediction_mask
 
-        inputs = self.processor(images=image, return_tensors="pt").to(self.device)
+    def predict_box_mask(self, image, crop_to_person=False):
+        """
+        Runs the model once and returns (mask, box). With `crop_to_person` the
+        logits are only upsampled inside the non-background extent of the
+        low-resolution prediction, so `mask` covers `box` (left, top, right, bottom)
+        in image coordinates instead of the whole image.
+        """
+        inputs = self.processor(images=image, return_tensors="pt")
+        logits = self.runtime.predict_logits(inputs['pixel_values'])
+        width, height = image.size
 
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+        with torch.inference_mode():
+            # Window of logit cells to upsample: everything, or the person region.
+            cells_h, cells_w = logits.shape[-2:]
+            cell_box = (0, 0, cells_w, cells_h)
+            if crop_to_person:
+                foreground = logits[0].argmax(dim=0) != self.background_id
+                if foreground.any():
+                    ys, xs = torch.nonzero(foreground, as_tuple=True)
+                    cell_box = expand_box(
+                        (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1),
+                        (cells_w, cells_h),
+                        PERSON_BOX_MARGIN,
+                    )
+            cx0, cy0, cx1, cy1 = cell_box
+            box = scale_box(cell_box, (cells_w, cells_h), (width, height))
 
-        logits = outputs.logits
+            # --- Upsample logits and get prediction mask ---
+            upsampled = torch.nn.functional.interpolate(
+                logits[:, :, cy0:cy1, cx0:cx1],
+                size=(box[3] - box[1], box[2] - box[0]),
+                mode="bilinear",
+                align_corners=False
+            )
+            return upsampled.argmax(dim=1)[0].numpy(), box
 
-        # --- Upsample logits and get prediction mask ---
-        upsampled = torch.nn.functional.interpolate(
-            logits,
-            size=image.size[::-1],  # (width, height) for Pillow
-            mode="bilinear",
-            align_corners=False
-        )
-        prediction_mask = upsampled.argmax(dim=1)[0].cpu().numpy()
+    def run_segmentation(self, image, crop_to_person=False):
+        """
+        Takes a PIL RGB image (or the path to one) and returns a dictionary of:
+        { 'category_name': <PIL.Image object of the RGBA segment> }
+        Segments always have the size of the input image, also when only the
+        person region was segmented.
+        """
+        if not isinstance(image, Image.Image):
+            try:
+                image = Image.open(image).convert("RGB")
+            except Exception as e:
+                print(f"Error opening image {image}: {e}")
+                return {}
+
+        box_mask, (left, top, right, bottom) = self.predict_box_mask(image, crop_to_person)
 
         original_image_np = np.array(image)
         segmented_images = {}
@@ -80,7 +259,7 @@ class SegFormerSegmenter:
         # Use our pre-filtered and remapped label map
         for category_name, label_id in self.label_map.items():
             # Create a boolean mask for the current category
-            class_mask = (prediction_mask == label_id)
+            class_mask = (box_mask == label_id)
 
             # If any pixel belongs to this class, extract it
             if class_mask.any():
@@ -90,8 +269,9 @@ class SegFormerSegmenter:
                 # Copy the original image's colors (RGB channels)
                 rgba_segment[..., :3] = original_image_np
 
-                # Set the Alpha channel: 255 (opaque) where the mask is true, 0 (transparent) otherwise
-                rgba_segment[..., 3] = class_mask * 255
+                # Set the Alpha channel: 255 (opaque) where the mask is true, 0 (transparent) otherwise.
+                # The mask only covers the segmented box, so map it back into image coordinates.
+                rgba_segment[top:bottom, left:right, 3] = class_mask * 255
 
                 # Convert the NumPy array back to a PIL Image object
                 segment_pil = Image.fromarray(rgba_segment)
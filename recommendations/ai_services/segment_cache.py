@@ -0,0 +1,44 @@
+"""
+Bounded in-process cache of segment pixels, keyed by segment id.
+
+The segmentation task puts each segment's Style2Vec input here so that, when
+the embedding step runs in the same worker process, it reads the pixels from
+memory instead of decoding the segment PNG from MEDIA_ROOT. Entries are removed
+when taken; the oldest ones are evicted once SEGMENT_CACHE_MAX_MB is reached,
+and a miss simply falls back to the stored file.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_size = {'bytes': 0}
+
+
+def put(segment_id, pixels):
+    """Caches a uint8 array for `segment_id`, evicting the oldest entries past the limit."""
+    max_bytes = settings.SEGMENT_CACHE_MAX_MB * 2 ** 20
+    if pixels.nbytes > max_bytes:
+        return
+    with _lock:
+        _discard(str(segment_id))
+        _entries[str(segment_id)] = pixels
+        _size['bytes'] += pixels.nbytes
+        while _size['bytes'] > max_bytes:
+            _, evicted = _entries.popitem(last=False)
+            _size['bytes'] -= evicted.nbytes
+
+
+def take(segment_id):
+    """Removes and returns the cached array for `segment_id`, or None."""
+    with _lock:
+        return _discard(str(segment_id))
+
+
+def _discard(key):
+    pixels = _entries.pop(key, None)
+    if pixels is not None:
+        _size['bytes'] -= pixels.nbytes
+    return pixels
@@ -185,12 +185,65 @@ class Style2VecSingleton:
             print(f"Error generating embedding for {image_path}: {e}")
             return None
     
+    def get_embeddings(self, image_paths, target='target'):
+        """
+        Generate embeddings for several images with one batched forward pass
+        
+        Args:
+            image_paths: Paths to the image files
+            target: 'target' or 'context' model to use
+            
+        Returns:
+            list: One embedding (list of floats) per path, None where the image could not be read
+        """
+        if not self._is_loaded:
+            raise RuntimeError("Style2Vec model not loaded")
+        
+        arrays = []
+        for image_path in image_paths:
+            try:
+                img = load_img(image_path, target_size=(299, 299))
+                arrays.append(tf.keras.preprocessing.image.img_to_array(img) / 255.0)
+            except Exception as e:
+                print(f"Error loading image {image_path}: {e}", file=sys.stderr)
+                arrays.append(None)
+        
+        loaded = [array for array in arrays if array is not None]
+        if not loaded:
+            return [None] * len(image_paths)
+        
+        model = self._model.model_target if target == 'target' else self._model.model_context
+        embeddings = iter(model.predict(np.stack(loaded), verbose=0))
+        return [next(embeddings).flatten().tolist() if array is not None else None for array in arrays]
+    
+    def get_embeddings_from_pixels(self, pixels, target='target'):
+        """
+        Generate embeddings for images that are already decoded and resized
+        
+        Args:
+            pixels: uint8 array of shape (N, 299, 299, 3), RGB
+            target: 'target' or 'context' model to use
+            
+        Returns:
+            list: One embedding (list of floats) per image
+        """
+        if not self._is_loaded:
+            raise RuntimeError("Style2Vec model not loaded")
+        
+        model = self._model.model_target if target == 'target' else self._model.model_context
+        embeddings = model.predict(pixels.astype(np.float32) / 255.0, verbose=0)
+        return [embedding.flatten().tolist() for embedding in embeddings]
+    
     def is_loaded(self):
         """Check if model is loaded"""
         return self._is_loaded
 
-# Global instance
-style2vec_model = Style2VecSingleton()
+def get_style2vec_model():
+    """
+    Returns the global Style2Vec instance, loading the model on first call
+    instead of when this module is imported.
+    """
+    return Style2VecSingleton()
 
 def get_style2vec_embedding(image_path, target='target'):
     """
@@ -203,29 +256,41 @@ def get_style2vec_embedding(image_path, target='target'):
     Returns:
         list: Embedding vector as a list of floats
     """
-    return style2vec_model.get_embedding(image_path, target)
+    return get_style2vec_model().get_embedding(image_path, target)
 
 # For backward compatibility with subprocess approach
 if __name__ == '__main__':
     import sys
     
     if len(sys.argv) < 2:
-        print("Usage: python style2vec_singleton.py <image_path> [target|context]", file=sys.stderr)
+        print("Usage: python style2vec_singleton.py <image_path> [<image_path> ...] [target|context]\n"
+              "       python style2vec_singleton.py --stdin [target|context]  (raw uint8 299x299 RGB images on stdin)",
+              file=sys.stderr)
         sys.exit(1)
     
-    image_path = sys.argv[1]
-    target = sys.argv[2] if len(sys.argv) > 2 else 'target'
+    args = sys.argv[1:]
+    target = 'target'
+    if len(args) > 1 and args[-1] in ('target', 'context'):
+        target = args.pop()
     
     try:
-        embedding_vector = get_style2vec_embedding(image_path, target)
-        
-        if embedding_vector:
-            # Output as JSON for subprocess compatibility
-            print(json.dumps({'embedding': embedding_vector}))
+        if args == ['--stdin']:
+            # Pixels handed over by the worker: no image files to decode
+            pixels = np.frombuffer(sys.stdin.buffer.read(), dtype=np.uint8).reshape(-1, 299, 299, 3)
+            print(json.dumps({'embeddings': get_style2vec_model().get_embeddings_from_pixels(pixels, target)}))
+        elif len(args) == 1:
+            embedding_vector = get_style2vec_embedding(args[0], target)
+            
+            if embedding_vector:
+                # Output as JSON for subprocess compatibility
+                print(json.dumps({'embedding': embedding_vector}))
+            else:
+                print("Failed to generate embedding", file=sys.stderr)
+                sys.exit(1)
         else:
-            print("Failed to generate embedding", file=sys.stderr)
-            sys.exit(1)
+            # Several images: load the model once and embed them in one batch
+            print(json.dumps({'embeddings': get_style2vec_model().get_embeddings(args, target)}))
             
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
\ No newline at end of file
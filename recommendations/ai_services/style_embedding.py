@@ -2,86 +2,181 @@
 
 import json
 import subprocess
+import time
+import numpy as np
 from celery import shared_task
+from django.conf import settings
 from django.db import transaction
 import os
 
+from fashionRecommendationSystem import lanes, locks
+
 # استيراد الموديلات
 from ..models import ImageSegment, StyleEmbedding
 from .recommender_service import get_recommendations
+from . import segment_cache
 
 
-@shared_task
-def process_style_embedding(image_segment_id, gender=None):
+class Style2VecOutputError(ValueError):
+    """style2vec_singleton.py ran but printed no JSON result."""
+
+
+def _run_style2vec(args, pixels=None):
     """
-    Celery task to generate style embedding for an ImageSegment.
-    Uses singleton model for better performance - loads once, reuses many times.
+    Runs style2vec_singleton.py in the style2vec_env interpreter and returns the
+    parsed JSON it prints. `pixels` (uint8 array) is streamed over stdin.
+    Raises subprocess.CalledProcessError / json.JSONDecodeError / Style2VecOutputError.
+    """
+    # Path to the virtual environment's python interpreter
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.abspath(os.path.join(current_dir, '..', '..'))
+    venv_python = os.path.join(project_root, 'style2vec_env', 'Scripts', 'python.exe')
+
+    # Path to the singleton script
+    script_path = os.path.join(current_dir, 'style2vec_singleton.py')
+
+    result = subprocess.run(
+        [venv_python, script_path, *args],
+        input=pixels.tobytes() if pixels is not None else None,
+        capture_output=True,
+        check=True
+    )
+
+    # Parse the JSON output
+    stdout = result.stdout.decode(errors='replace')
+    json_line = next((line for line in stdout.splitlines() if line.strip().startswith('{')), None)
+    if not json_line:
+        raise Style2VecOutputError("Failed to find JSON output from the script.")
+    return json.loads(json_line)
+
+
+def generate_style_embeddings(image_paths):
+    """
+    Generates Style2Vec embeddings for several images with a single run of the
+    style2vec_env interpreter, so the model is loaded once per batch instead of
+    once per image. Returns one vector per path (None where it failed).
+    """
+    # The trailing 'target' keeps a single path in batch mode as well.
+    embedding_data = _run_style2vec([*image_paths, 'target'])
+    if 'embeddings' in embedding_data:
+        return embedding_data['embeddings']
+    return [embedding_data.get('embedding')]
+
+
+def generate_style_embeddings_from_pixels(pixels):
+    """
+    Same as generate_style_embeddings for images that are already in memory:
+    `pixels` is a list of uint8 (299, 299, 3) arrays (see to_style2vec_input),
+    sent over stdin so nothing is encoded, written or decoded on the way.
+    """
+    return _run_style2vec(['--stdin', 'target'], np.stack(pixels))['embeddings']
+
+
+def _embed_segments(segments):
+    """
+    Embeds segments, taking their pixels from the in-process segment cache when
+    segmentation ran in this process and from the stored PNG otherwise. The two
+    groups run separately: when one run of the script fails, only its segments
+    are left without a vector (None).
     """
+    cached = {segment.segmentId: segment_cache.take(segment.segmentId) for segment in segments}
+    in_memory = [segment for segment in segments if cached[segment.segmentId] is not None]
+    on_disk = [segment for segment in segments if cached[segment.segmentId] is None]
+    print(f"Embedding {len(in_memory)} segment(s) from memory and {len(on_disk)} from disk.")
+
+    vectors = {}
+    if in_memory:
+        vectors.update(_run_group(
+            in_memory, generate_style_embeddings_from_pixels, [cached[segment.segmentId] for segment in in_memory]
+        ))
+    if on_disk:
+        vectors.update(_run_group(
+            on_disk, generate_style_embeddings, [segment.image_url.path for segment in on_disk]
+        ))
+    return [vectors.get(segment.segmentId) for segment in segments]
+
+
+def _run_group(segments, embed, inputs):
+    """{segment id: vector} from one run of the embedding script; empty if the run failed."""
     try:
-        segment = ImageSegment.objects.get(segmentId=image_segment_id)
-    except ImageSegment.DoesNotExist:
-        print(f"ImageSegment with id {image_segment_id} not found.")
-        return
+        return dict(zip((segment.segmentId for segment in segments), embed(inputs)))
+    except subprocess.CalledProcessError as e:
+        print(f"Error running the embedding script: {e}")
+        print(f"Stderr: {(e.stderr or b'').decode(errors='replace')}")
+    except (json.JSONDecodeError, Style2VecOutputError) as e:
+        print(f"Failed to read embeddings from script output: {e}")
+    return {}
 
-    # Path to the image segment
-    image_path = segment.image_url.path
 
-    # Use the singleton approach for better performance
-    # The model will be loaded only once and reused for all subsequent calls
+@shared_task(priority=lanes.INTERACTIVE)
+def process_style_embeddings(image_segment_ids, gender=None):
+    """
+    Celery task to generate style embeddings for a batch of ImageSegments.
+    This is the embedding stage of the style image pipeline (see tasks.py):
+    it returns the ids of the segments that got an embedding and how long it took.
+    """
+    started = time.monotonic()
+    segments = list(ImageSegment.objects.filter(segmentId__in=image_segment_ids).select_related('styleembedding'))
+    if not segments:
+        print(f"No ImageSegments found for ids {image_segment_ids}.")
+        return {'segment_ids': [], 'seconds': time.monotonic() - started}
+
+    # Idempotent under redelivery: segments that already have an embedding are
+    # not embedded again, and segments another task is embedding right now are skipped.
+    done = [segment for segment in segments if hasattr(segment, 'styleembedding')]
+    pending = [segment for segment in segments if not hasattr(segment, 'styleembedding')]
+    locked = [segment for segment in pending
+              if locks.acquire(f'embedding:{segment.segmentId}', settings.TASK_LOCK_TIMEOUT)]
+    if len(locked) < len(pending):
+        print(f"Skipping {len(pending) - len(locked)} segment(s) already being embedded by another task.")
+
     try:
-        # Path to the virtual environment's python interpreter
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.abspath(os.path.join(current_dir, '..', '..'))
-        venv_python = os.path.join(project_root, 'style2vec_env', 'Scripts', 'python.exe')
-
-        # Path to the singleton script
-        script_path = os.path.join(current_dir, 'style2vec_singleton.py')
-
-        # Run the singleton script in the style2vec_env
-        result = subprocess.run(
-            [venv_python, script_path, image_path],
-            capture_output=True,
-            text=True,
-            check=True
+        embeddings = _create_embeddings(locked)
+    finally:
+        for segment in locked:
+            locks.release(f'embedding:{segment.segmentId}')
+    print(f"Embedding complete for {len(embeddings)} of {len(locked)} segments "
+          f"({len(done)} already embedded).")
+
+    return {
+        'segment_ids': [str(segment.segmentId) for segment in done] + [str(embedding.segment_id) for embedding in embeddings],
+        'seconds': time.monotonic() - started,
+    }
+
+
+def _create_embeddings(segments):
+    """Embeds the segments and upserts their StyleEmbedding rows (keyed by segment)."""
+    if not segments:
+        return []
+    vectors = _embed_segments(segments)
+
+    embeddings = [
+        StyleEmbedding(segment=segment, embeddings=vector)
+        for segment, vector in zip(segments, vectors)
+        if vector
+    ]
+    with transaction.atomic():
+        StyleEmbedding.objects.bulk_create(
+            embeddings,
+            update_conflicts=True,
+            unique_fields=['segment'],
+            update_fields=['embeddings'],
         )
+    return embeddings
 
-        # Parse the JSON output
-        json_line = None
-        for line in result.stdout.splitlines():
-            if line.strip().startswith('{'):
-                json_line = line
-                break
-
-        if json_line:
-            embedding_data = json.loads(json_line)
-            embedding_vector = embedding_data.get('embedding')
-        else:
-            print("Failed to find JSON output from the script.")
-            return "Failed to find JSON output."
-
-        if embedding_vector:
-            with transaction.atomic():
-                embedding = StyleEmbedding.objects.create(
-                    segment=segment,
-                    embeddings=embedding_vector
-                )
-                print(f"Embedding complete for segment {segment.segmentId}.")
-
-            # Get recommendations (filtered by gender if provided)
-            recommended_products = get_recommendations(image_segment_id, gender=gender)
-            print(f"Recommendations found: {[p.name for p in recommended_products]}")
-            return f"Embedding complete and recommendations found for segment {segment.segmentId}"
-        else:
-            print("Failed to get embedding vector from the script.")
-            return "Failed to get embedding vector."
 
-    except subprocess.CalledProcessError as e:
-        print(f"Error running the embedding script: {e}")
-        print(f"Stderr: {e.stderr}")
-        return f"Error during embedding generation: {e}"
-    except json.JSONDecodeError:
-        print("Failed to decode JSON from script output.")
-        return "JSON decode error."
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return f"An unexpected error occurred: {e}"
+@shared_task(priority=lanes.INTERACTIVE)
+def process_style_embedding(image_segment_id, gender=None):
+    """
+    Celery task to generate style embedding for an ImageSegment.
+    Embeds a single segment and logs its recommendations. The style image
+    pipeline uses the batched process_style_embeddings instead.
+    """
+    result = process_style_embeddings([image_segment_id], gender)
+    if not result['segment_ids']:
+        return "Failed to get embedding vector."
+
+    # Get recommendations (filtered by gender if provided)
+    recommended_products = get_recommendations(image_segment_id, gender=gender)
+    print(f"Recommendations found: {[p.name for p in recommended_products]}")
+    return f"Embedding complete and recommendations found for segment {image_segment_id}"
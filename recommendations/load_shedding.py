@@ -0,0 +1,106 @@
+"""
+Load shedding for style uploads.
+
+Before queuing a new upload, StyleImageViewSet.create() estimates how long it
+would wait behind the interactive uploads already in the inference queue:
+queue depth x average segmentation and embedding time / inference processes.
+Past LOAD_SHEDDING_MAX_WAIT_SECONDS the upload is still queued, but the
+response also carries cached popular products for the user's gender and the
+categories of their earlier uploads, and says that results will follow.
+"""
+from celery import current_app
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from fashionRecommendationSystem import metrics
+from products.models import Product
+from .models import ImageSegment
+
+INFERENCE_QUEUE = 'inference'
+DEPTH_CACHE_KEY = 'load_shedding:inference_depth'
+POPULAR_CACHE_KEY = 'load_shedding:popular:{gender}:{category}'
+
+
+def interactive_queue_depth():
+    """
+    Interactive uploads waiting in the inference queue, cached for a few seconds
+    so uploads do not each ask the broker. None when the broker cannot be reached.
+    """
+    depth = cache.get(DEPTH_CACHE_KEY)
+    if depth is not None:
+        return depth
+    try:
+        with current_app.connection_for_read() as connection:
+            channel = connection.default_channel
+            client = getattr(channel, 'client', None)
+            if client is not None:
+                # Redis keeps priority 0 (the interactive lane) in the list named after the queue.
+                depth = client.llen(INFERENCE_QUEUE)
+            else:
+                depth = channel.queue_declare(queue=INFERENCE_QUEUE, passive=True).message_count
+    except Exception as e:
+        print(f"Could not read the {INFERENCE_QUEUE} queue depth: {e}")
+        return None
+    cache.set(DEPTH_CACHE_KEY, depth, timeout=settings.LOAD_SHEDDING_CHECK_SECONDS)
+    return depth
+
+
+def estimated_wait_seconds():
+    """Seconds a new upload would wait before its segmentation starts, or None if unknown."""
+    depth = interactive_queue_depth()
+    if depth is None:
+        return None
+    seconds_per_upload = sum(
+        metrics.average(stage) or 0 for stage in ('pipeline.segmentation', 'pipeline.embedding')
+    ) or settings.LOAD_SHEDDING_DEFAULT_UPLOAD_SECONDS
+    processes = max(settings.WORKER_PROFILES['inference']['concurrency'], 1)
+    return depth * seconds_per_upload / processes
+
+
+def should_shed():
+    """(shed, estimated wait in seconds). Never sheds when the wait cannot be estimated."""
+    if not settings.LOAD_SHEDDING_MAX_WAIT_SECONDS:
+        return False, None
+    wait = estimated_wait_seconds()
+    return wait is not None and wait > settings.LOAD_SHEDDING_MAX_WAIT_SECONDS, wait
+
+
+def popular_products(user, gender=None):
+    """
+    Most recommended in-stock products for `gender` in the categories of the
+    user's earlier segments (all categories for a first upload).
+    """
+    category_ids = list(
+        ImageSegment.objects.filter(style_image__user=user)
+        .values_list('category_type_id', flat=True).distinct()
+    ) or [None]
+
+    product_ids = []
+    for category_id in category_ids:
+        for product_id in _popular_product_ids(gender, category_id):
+            if product_id not in product_ids:
+                product_ids.append(product_id)
+    product_ids = product_ids[:settings.DEGRADED_RESULT_SIZE]
+
+    products = Product.objects.filter(productId__in=product_ids).prefetch_related('images')
+    by_id = {product.productId: product for product in products}
+    return [by_id[product_id] for product_id in product_ids if product_id in by_id]
+
+
+def _popular_product_ids(gender, category_id):
+    key = POPULAR_CACHE_KEY.format(gender=(gender or 'any').lower(), category=category_id or 'all')
+    product_ids = cache.get(key)
+    if product_ids is None:
+        products = Product.objects.filter(stock_quantity__gt=0)
+        if gender:
+            products = products.filter(Q(gender__iexact=gender) | Q(gender__isnull=True) | Q(gender="Unisex"))
+        if category_id:
+            products = products.filter(categories=category_id)
+        product_ids = list(
+            products.annotate(times_recommended=Count('recommendationlog'))
+            .order_by('-times_recommended', '-created_at')
+            .values_list('productId', flat=True)[:settings.DEGRADED_RESULT_SIZE]
+        )
+        cache.set(key, product_ids, timeout=settings.POPULAR_PRODUCTS_CACHE_SECONDS)
+    return product_ids
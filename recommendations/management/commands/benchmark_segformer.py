@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+from PIL import Image
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendations.ai_services.segformer_segmenter import SegFormerSegmenter, RUNTIMES, TorchRuntime
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the SegFormer runtimes and reports mask agreement against eager torch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='+', help='Paths of the images to segment.')
+        parser.add_argument(
+            '--runtimes',
+            nargs='+',
+            default=list(RUNTIMES),
+            help=f'Runtimes to compare. Defaults to all of: {", ".join(RUNTIMES)}.'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Timed runs per image (after one warm-up run).'
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['runtimes']) - set(RUNTIMES)
+        if unknown:
+            raise CommandError(f"Unknown runtimes: {', '.join(sorted(unknown))}")
+
+        try:
+            images = [Image.open(path).convert("RGB") for path in options['images']]
+        except OSError as e:
+            raise CommandError(f"Could not open image: {e}")
+
+        # Eager torch is the reference every other runtime is compared against.
+        runtimes = [TorchRuntime.name] + [r for r in options['runtimes'] if r != TorchRuntime.name]
+        reference_masks = None
+        label_ids = None
+
+        self.stdout.write(f"{'runtime':<10} {'load s':>8} {'mean ms':>9} {'p95 ms':>9} {'pixel agr.':>11} {'mIoU':>7}")
+        for runtime in runtimes:
+            started = time.perf_counter()
+            segmenter = SegFormerSegmenter(runtime)
+            load_seconds = time.perf_counter() - started
+            label_ids = label_ids or sorted(set(segmenter.label_map.values()))
+
+            timings = []
+            masks = []
+            for image in images:
+                segmenter.predict_mask(image)  # warm-up
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    mask = segmenter.predict_mask(image)
+                    timings.append((time.perf_counter() - started) * 1000)
+                masks.append(mask)
+
+            if reference_masks is None:
+                reference_masks = masks
+            agreement, mean_iou = self.compare(reference_masks, masks, label_ids)
+
+            self.stdout.write(
+                f"{runtime:<10} {load_seconds:>8.2f} {np.mean(timings):>9.1f} "
+                f"{np.percentile(timings, 95):>9.1f} {agreement:>10.2%} {mean_iou:>7.3f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("--- Benchmark Complete ---"))
+
+    @staticmethod
+    def compare(reference_masks, masks, label_ids):
+        """Pixel agreement and mean IoU over the kept garment labels."""
+        matching = total = 0
+        ious = []
+        for reference, mask in zip(reference_masks, masks):
+            matching += int((reference == mask).sum())
+            total += reference.size
+            for label_id in label_ids:
+                expected, actual = reference == label_id, mask == label_id
+                union = np.logical_or(expected, actual).sum()
+                if union:
+                    ious.append(np.logical_and(expected, actual).sum() / union)
+        return matching / total, float(np.mean(ious)) if ious else 1.0
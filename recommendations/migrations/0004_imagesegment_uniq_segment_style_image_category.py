@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+def delete_duplicate_segments(apps, schema_editor):
+    """
+    Keeps one ImageSegment per (style_image, category_type), preferring one that
+    already has a StyleEmbedding, and deletes the rest (with their embeddings).
+    """
+    ImageSegment = apps.get_model('recommendations', 'ImageSegment')
+    StyleEmbedding = apps.get_model('recommendations', 'StyleEmbedding')
+
+    embedded = set(StyleEmbedding.objects.filter(segment__isnull=False).values_list('segment_id', flat=True))
+    kept = {}
+    duplicates = []
+    for segment_id, style_image_id, category_id in (
+        ImageSegment.objects.order_by('style_image_id', 'category_type_id')
+        .values_list('segmentId', 'style_image_id', 'category_type_id')
+    ):
+        key = (style_image_id, category_id)
+        if key not in kept:
+            kept[key] = segment_id
+        elif segment_id in embedded and kept[key] not in embedded:
+            duplicates.append(kept[key])
+            kept[key] = segment_id
+        else:
+            duplicates.append(segment_id)
+
+    if duplicates:
+        ImageSegment.objects.filter(segmentId__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0003_alter_styleembedding_embeddings'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_segments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='imagesegment',
+            constraint=models.UniqueConstraint(fields=('style_image', 'category_type'), name='uniq_segment_style_image_category'),
+        ),
+    ]
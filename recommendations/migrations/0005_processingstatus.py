@@ -0,0 +1,25 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0004_imagesegment_uniq_segment_style_image_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingStatus',
+            fields=[
+                ('style_image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='processing_status', serialize=False, to='recommendations.styleimage')),
+                ('state', models.CharField(choices=[('QUEUED', 'Queued'), ('SEGMENTING', 'Segmenting'), ('EMBEDDING', 'Embedding'), ('RETRIEVING', 'Retrieving'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', max_length=10)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('queued_at', models.DateTimeField(auto_now_add=True)),
+                ('segmenting_at', models.DateTimeField(blank=True, null=True)),
+                ('embedding_at', models.DateTimeField(blank=True, null=True)),
+                ('retrieving_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0005_processingstatus'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recommendationlog',
+            index=models.Index(fields=['user', 'created_at', 'logId'], name='reclog_user_created_pk_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.db.models import Min, OuterRef, Subquery
+
+
+def backfill_processing_status(apps, schema_editor):
+    """
+    Gives every StyleImage uploaded before ProcessingStatus existed a status row:
+    DONE (finished when its first recommendation log was written, or at upload)
+    if it was segmented or has recommendations, QUEUED otherwise.
+    """
+    StyleImage = apps.get_model('recommendations', 'StyleImage')
+    ProcessingStatus = apps.get_model('recommendations', 'ProcessingStatus')
+    ImageSegment = apps.get_model('recommendations', 'ImageSegment')
+    RecommendationLog = apps.get_model('recommendations', 'RecommendationLog')
+
+    logged = dict(
+        RecommendationLog.objects.values('style_image_id').annotate(first=Min('created_at'))
+        .values_list('style_image_id', 'first')
+    )
+    segmented = set(ImageSegment.objects.values_list('style_image_id', flat=True).distinct())
+
+    statuses = []
+    for style_image_id, uploaded_at in (
+        StyleImage.objects.filter(processing_status__isnull=True).values_list('styleImageId', 'uploaded_at')
+    ):
+        if style_image_id in logged or style_image_id in segmented:
+            statuses.append(ProcessingStatus(style_image_id=style_image_id, state='DONE',
+                                             finished_at=logged.get(style_image_id, uploaded_at)))
+        else:
+            statuses.append(ProcessingStatus(style_image_id=style_image_id, state='QUEUED'))
+    ProcessingStatus.objects.bulk_create(statuses, batch_size=1000)
+
+    # queued_at is auto_now_add: date the backfilled rows from the upload instead.
+    ProcessingStatus.objects.filter(style_image_id__in=[status.style_image_id for status in statuses]).update(
+        queued_at=Subquery(StyleImage.objects.filter(styleImageId=OuterRef('style_image_id')).values('uploaded_at'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0006_recommendationlog_reclog_user_created_pk_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_processing_status, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 
 import uuid
 from django.db import models
+from django.utils import timezone
 from pgvector.django import VectorField
 
 from users.models import User
@@ -20,6 +21,69 @@ class StyleImage(models.Model):
         return f"Anonymous Style Image ({self.uploaded_at.strftime('%Y-%m-%d')})"
 
 
+class ProcessingStatus(models.Model):
+    """Where a StyleImage is in the segmentation pipeline, with the time each stage started."""
+
+    class State(models.TextChoices):
+        QUEUED = 'QUEUED', 'Queued'
+        SEGMENTING = 'SEGMENTING', 'Segmenting'
+        EMBEDDING = 'EMBEDDING', 'Embedding'
+        RETRIEVING = 'RETRIEVING', 'Retrieving'
+        DONE = 'DONE', 'Done'
+        FAILED = 'FAILED', 'Failed'
+
+    # The timestamp field each state sets when it is entered.
+    STAGE_FIELDS = {
+        State.SEGMENTING: 'segmenting_at',
+        State.EMBEDDING: 'embedding_at',
+        State.RETRIEVING: 'retrieving_at',
+        State.DONE: 'finished_at',
+        State.FAILED: 'finished_at',
+    }
+
+    style_image = models.OneToOneField(StyleImage, on_delete=models.CASCADE, primary_key=True,
+                                       related_name='processing_status')
+    state = models.CharField(max_length=10, choices=State.choices, default=State.QUEUED)
+    error = models.CharField(max_length=255, blank=True)
+    queued_at = models.DateTimeField(auto_now_add=True)
+    segmenting_at = models.DateTimeField(null=True, blank=True)
+    embedding_at = models.DateTimeField(null=True, blank=True)
+    retrieving_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_state_display()}: {self.style_image}"
+
+    @classmethod
+    def advance(cls, style_image_id, state, error=''):
+        """Moves a style image to `state` and stamps the stage, in a single UPDATE."""
+        return cls.objects.filter(style_image_id=style_image_id).update(
+            state=state, error=error[:255], **{cls.STAGE_FIELDS[state]: timezone.now()}
+        )
+
+    @classmethod
+    def finished(cls, style_image_id):
+        """Whether the pipeline of a style image has ended, DONE or FAILED."""
+        return cls.objects.filter(
+            style_image_id=style_image_id, state__in=[cls.State.DONE, cls.State.FAILED]
+        ).exists()
+
+    def stage_seconds(self):
+        """Seconds spent in each stage reached so far (queue wait included), and in total."""
+        stamps = [
+            ('queued', self.queued_at), ('segmentation', self.segmenting_at), ('embedding', self.embedding_at),
+            ('retrieval', self.retrieving_at), ('finished', self.finished_at),
+        ]
+        reached = [(stage, stamp) for stage, stamp in stamps if stamp is not None]
+        seconds = {
+            stage: round((next_stamp - stamp).total_seconds(), 3)
+            for (stage, stamp), (_, next_stamp) in zip(reached, reached[1:])
+        }
+        if self.finished_at is not None:
+            seconds['total'] = round((self.finished_at - self.queued_at).total_seconds(), 3)
+        return seconds
+
+
 class ImageSegment(models.Model):  # Renamed for clarity from Image_Segments
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, name="segmentId")
     style_image = models.ForeignKey(StyleImage, on_delete=models.CASCADE, related_name='segments')
@@ -30,6 +94,13 @@ class ImageSegment(models.Model):  # Renamed for clarity from Image_Segments
     def __str__(self):
         return f"{self.category_type.name} segment from {self.style_image}"
 
+    class Meta:
+        # One segment per garment category of a style image, so a redelivered
+        # segmentation task upserts instead of adding duplicates.
+        constraints = [
+            models.UniqueConstraint(fields=['style_image', 'category_type'], name='uniq_segment_style_image_category')
+        ]
+
 
 class StyleEmbedding(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, name="embeddingId")
@@ -56,6 +127,12 @@ class RecommendationLog(models.Model):  # Renamed for clarity
     def __str__(self):
         return f"Recommendations for {self.user.username} ({self.created_at.strftime('%Y-%m-%d')})"
 
+    class Meta:
+        indexes = [
+            # Keyset pagination order of a user's history (see KeysetPagination)
+            models.Index(fields=['user', 'created_at', 'logId'], name='reclog_user_created_pk_idx'),
+        ]
+
 
 class Feedback(models.Model):  # Renamed for clarity
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, name="feedbackId")
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 
 from products.serializers import ProductMiniSerializer
-from .models import StyleImage, RecommendationLog, Feedback
+from .models import StyleImage, RecommendationLog, Feedback, ProcessingStatus
 
 
 class StyleImageSerializer(serializers.ModelSerializer):
@@ -11,6 +11,20 @@ class StyleImageSerializer(serializers.ModelSerializer):
         read_only_fields = ['styleImageId', 'uploaded_at']
 
 
+class ProcessingStatusSerializer(serializers.ModelSerializer):
+    styleImageId = serializers.UUIDField(source='style_image_id', read_only=True)
+    stage_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProcessingStatus
+        fields = ['styleImageId', 'state', 'error', 'queued_at', 'segmenting_at', 'embedding_at',
+                  'retrieving_at', 'finished_at', 'stage_seconds']
+        read_only_fields = fields
+
+    def get_stage_seconds(self, obj):
+        return obj.stage_seconds()
+
+
 # list: no products, keep user id + style_image
 class RecommendationLogListSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
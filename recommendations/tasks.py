@@ -1,46 +1,101 @@
 import io
+import os
+import time
 
-from celery import shared_task
+import numpy as np
+
+from celery import chord, shared_task
+from django.conf import settings
 from django.core.files.base import ContentFile
+from fashionRecommendationSystem import lanes, locks, metrics
 from users.notifications.tasks import send_notification_task
 
-from .models import StyleImage, ImageSegment, Category
-# from .ai_services.mmfashion_detector import MMFashionDetector
-# from .ai_services.fast_sam_segmenter import FastSAMSegmenter
+from .models import StyleImage, ImageSegment, Category, ProcessingStatus
+
+from .ai_services.style_embedding import process_style_embeddings
+from .ai_services.recommender_service import get_recommendations_for_segments
+from .ai_services.model_registry import get_segmenter, get_detector
+from .ai_services.image_preprocessing import load_capped_image, to_style2vec_input
+from .ai_services import segment_cache
+
+# How long a task waits before trying again for a lock held by another copy of it.
+LOCK_RETRY_SECONDS = 30
 
-from .ai_services.style_embedding import process_style_embedding
-from .ai_services.segformer_segmenter import SegFormerSegmenter
 
-# Initialize models once when the worker starts, not for every task.
-# detector = MMFashionDetector()
-# segmenter = FastSAMSegmenter()
-segmenter = SegFormerSegmenter()
+def retry_while_locked(task):
+    """
+    Retries `task` later because another copy holds its lock. That copy may still
+    be running, or it may have crashed and acks_late redelivered this one: the
+    retries outlast TASK_LOCK_TIMEOUT, so the work is picked up once the lock expires.
+    """
+    return task.retry(countdown=LOCK_RETRY_SECONDS, max_retries=settings.TASK_LOCK_TIMEOUT // LOCK_RETRY_SECONDS + 1)
 
 
-@shared_task
-def process_style_image_segmentation(style_image_id, gender=None):
+@shared_task(bind=True, priority=lanes.INTERACTIVE)
+def process_style_image_segmentation(self, style_image_id, gender=None):
     """
     Celery task to perform AI segmentation on a StyleImage.
+    First stage of the style image pipeline: the segments are embedded in batches
+    (process_style_embeddings) and, once every batch is done, finalize_style_image
+    retrieves products for all of them and notifies the user once.
+
+    The segment PNGs are written first. With STYLE_SEGMENT_MEMORY_HANDOFF the
+    batches then run right here on the in-memory pixels, so nothing is read
+    back from disk; otherwise they run as a chord on any worker.
     """
     print(f"Processing segmentation for image ID: {style_image_id}")
+    started = time.monotonic()
     try:
         style_image = (
             StyleImage.objects
             .select_related("user")
             .get(styleImageId=style_image_id)
         )
-        user_id = style_image.user_id
     except StyleImage.DoesNotExist:
         return f"StyleImage with id {style_image_id} not found."
 
-    image_path = style_image.image_url.path
+    # At-least-once delivery: a redelivered copy must neither run the models again
+    # while the first one is still busy nor redo finished work.
+    with locks.held(f'segmentation:{style_image_id}', settings.TASK_LOCK_TIMEOUT) as acquired:
+        if not acquired:
+            raise retry_while_locked(self)
+        if style_image.segments.exists() and not style_image.segments.filter(styleembedding__isnull=True).exists():
+            if ProcessingStatus.finished(style_image_id):
+                return f"StyleImage {style_image_id} was already processed."
+            # Every segment is embedded but retrieval never ran (a crash before finalize was queued).
+            segment_ids = [str(segment_id) for segment_id in style_image.segments.values_list('segmentId', flat=True)]
+            finalize_style_image.delay([{'segment_ids': segment_ids, 'seconds': None}], str(style_image_id), gender)
+            return f"StyleImage {style_image_id} was already embedded, retrieval queued."
+        ProcessingStatus.advance(style_image_id, ProcessingStatus.State.SEGMENTING)
+        try:
+            return segment_style_image(style_image, gender, started)
+        except Exception as e:
+            ProcessingStatus.advance(style_image_id, ProcessingStatus.State.FAILED, str(e))
+            raise
+
+
+def segment_style_image(style_image, gender, started):
+    """Body of process_style_image_segmentation, run while holding the style image's lock."""
+    style_image_id = style_image.styleImageId
+    try:
+        image = prepare_style_image(style_image)
+    except OSError as e:
+        return stop_processing(style_image_id, f"Could not read StyleImage {style_image_id}: {e}")
+
+    # Cheap pre-filter: skip segmentation when the detector finds no garment at all.
+    if settings.SEGMENTATION_DETECTOR_GATE:
+        detector = get_detector()
+        garments = detector.garment_categories(detector.detect_categories(np.array(image)))
+        if not garments:
+            return stop_processing(style_image_id, f"No garments detected in StyleImage {style_image_id}.")
 
-    segmented_images = segmenter.run_segmentation(image_path)
+    # The model is loaded on first use (or by the worker warm-up), never at import.
+    segmented_images = get_segmenter().run_segmentation(image, crop_to_person=settings.STYLE_IMAGE_PERSON_CROP)
 
     if not segmented_images:
-        return f"No valid segments found for StyleImage {style_image_id}."
+        return stop_processing(style_image_id, f"No valid segments found for StyleImage {style_image_id}.")
 
-    saved_categories = []
+    segments = []
     for category_name, segment_pil_image in segmented_images.items():
         try:
             # Look up the category in our database. The names from the service are already lowercase.
@@ -49,34 +104,155 @@ def process_style_image_segmentation(style_image_id, gender=None):
             print(f"WARNING: Category '{category_name}' found by AI but does not exist in the database. Skipping.")
             continue
 
-        # --- Save the PIL Image to the ImageField ---
-        # Create a new ImageSegment instance
-        segment = ImageSegment.objects.create(
+        segment = ImageSegment(
             style_image=style_image,
             category_type=category_obj
         )
+        segments.append((segment, segment_pil_image, f"{style_image_id}_{category_name}.png"))
 
-        # Convert PIL RGBA image to bytes in-memory
-        buffer = io.BytesIO()
-        segment_pil_image.save(buffer, format='PNG')  # Save as PNG to keep transparency
-        image_content = ContentFile(buffer.getvalue())
+    if not segments:
+        return stop_processing(style_image_id, f"No known categories among the segments of StyleImage {style_image_id}.")
+
+    # Upsert on (style_image, category): a rerun reuses the existing rows. bulk_create
+    # does not copy an existing row's primary key back onto the object, so the rows
+    # are read again and matched by category before their ids are used.
+    ImageSegment.objects.bulk_create(
+        [segment for segment, _, _ in segments],
+        update_conflicts=True,
+        unique_fields=['style_image', 'category_type'],
+        update_fields=['category_type'],
+    )
+    stored = {
+        segment.category_type_id: segment
+        for segment in ImageSegment.objects.filter(
+            style_image=style_image,
+            category_type__in=[segment.category_type_id for segment, _, _ in segments],
+        )
+    }
+    segments = [(stored[segment.category_type_id], pil_image, filename) for segment, pil_image, filename in segments]
 
-        # Save the content to the ImageField
-        segment_filename = f"{style_image_id}_{category_name}.png"
-        segment.image_url.save(segment_filename, image_content, save=True)
+    segmentation_seconds = time.monotonic() - started
+    metrics.observe('pipeline.segmentation', segmentation_seconds)
+    metrics.incr('pipeline.segments', len(segments))
+    ProcessingStatus.advance(style_image_id, ProcessingStatus.State.EMBEDDING)
+    started_at = time.time() - segmentation_seconds
 
-        saved_categories.append(category_name)
+    segment_ids = [str(segment.segmentId) for segment, _, _ in segments]
+    batch_size = max(settings.STYLE_EMBEDDING_BATCH_SIZE, 1)
+    batches = [segment_ids[i:i + batch_size] for i in range(0, len(segment_ids), batch_size)]
 
-        # --- TRIGGER THE EMBEDDING TASK ---
-        # Call the new task to process the created segment
-        process_style_embedding.delay(segment.segmentId, gender)
-        print(f"Triggered embedding task for segment ID: {segment.segmentId}")
+    # The PNGs are written first in both modes: the results announced by
+    # finalize_style_image show them, and a segment the embedding step does not
+    # find in memory is read back from its file.
+    for segment, segment_pil_image, filename in segments:
+        save_segment_image(segment, segment_pil_image, filename)
+
+    if settings.STYLE_SEGMENT_MEMORY_HANDOFF:
+        # --- EMBED IN THIS PROCESS, STRAIGHT FROM THE SEGMENT PIXELS ---
+        for segment, segment_pil_image, _ in segments:
+            segment_cache.put(segment.segmentId, to_style2vec_input(segment_pil_image))
+        try:
+            embedding_results = [process_style_embeddings(batch, gender) for batch in batches]
+        finally:
+            # Entries the embedding step did not take (it failed) must not linger.
+            for segment, _, _ in segments:
+                segment_cache.take(segment.segmentId)
+        finalize_style_image.delay(embedding_results, str(style_image_id), gender, started_at)
+    else:
+        # --- TRIGGER THE EMBEDDING BATCHES AND RETRIEVAL ---
+        chord(
+            [process_style_embeddings.s(batch, gender) for batch in batches],
+            finalize_style_image.s(str(style_image_id), gender, started_at)
+        ).apply_async()
+        print(f"Triggered {len(batches)} embedding batch(es) for {len(segment_ids)} segments.")
+
+    return f"Segmentation complete for StyleImage {style_image_id}. Saved {len(segment_ids)} segments."
+
+
+def stop_processing(style_image_id, message):
+    """Ends the pipeline of a style image early: marks it failed with `message` and returns it."""
+    ProcessingStatus.advance(style_image_id, ProcessingStatus.State.FAILED, message)
+    return message
 
-    send_notification_task.delay(
-        user_id=user_id,
-        title="Results are ready!",
-        message=f"We found {len(saved_categories) * 10} products that fit your style.",
-        payload={"style_image": str(style_image)},
-    )
 
-    return f"Segmentation complete for StyleImage {style_image_id}. Saved segments for: {saved_categories}"
+def save_segment_image(segment, segment_pil_image, filename):
+    """Writes a segment as a PNG (keeping its transparency) to the segment's ImageField."""
+    # Convert PIL RGBA image to bytes in-memory
+    buffer = io.BytesIO()
+    segment_pil_image.save(buffer, format='PNG')  # Save as PNG to keep transparency
+    segment.image_url.save(filename, ContentFile(buffer.getvalue()), save=True)
+
+
+@shared_task(bind=True)
+def finalize_style_image(self, embedding_results, style_image_id, gender=None, started_at=None):
+    """
+    Last stage of the style image pipeline, run once every embedding batch is done:
+    retrieves products for all embedded segments together and sends the user a
+    single notification with the real number of products found. Runs once per
+    image: a second copy (redelivered, or queued again for an image stuck after
+    embedding) finds it DONE or FAILED and stops.
+    """
+    try:
+        style_image = StyleImage.objects.get(styleImageId=style_image_id)
+    except StyleImage.DoesNotExist:
+        return f"StyleImage with id {style_image_id} not found."
+
+    with locks.held(f'finalize:{style_image_id}', settings.TASK_LOCK_TIMEOUT) as acquired:
+        if not acquired:
+            raise retry_while_locked(self)
+        if ProcessingStatus.finished(style_image_id):
+            return f"Retrieval for StyleImage {style_image_id} already ran."
+        return retrieve_for_style_image(style_image, embedding_results, gender, started_at)
+
+
+def retrieve_for_style_image(style_image, embedding_results, gender, started_at):
+    """Body of finalize_style_image, run while holding the style image's finalize lock."""
+    style_image_id = style_image.styleImageId
+    retrieval_started = time.monotonic()
+    segment_ids = [segment_id for result in embedding_results for segment_id in result['segment_ids']]
+    for result in embedding_results:
+        if result['seconds'] is not None:
+            metrics.observe('pipeline.embedding', result['seconds'])
+
+    if not segment_ids:
+        # Every batch failed to embed: there is nothing to retrieve and no results to announce.
+        return stop_processing(style_image_id, f"No segments of StyleImage {style_image_id} could be embedded.")
+    ProcessingStatus.advance(style_image_id, ProcessingStatus.State.RETRIEVING)
+
+    recommendations = get_recommendations_for_segments(segment_ids, gender=gender)
+    product_count = len({product.pk for products in recommendations.values() for product in products})
+    metrics.observe('pipeline.retrieval', time.monotonic() - retrieval_started)
+    # Done before the push goes out, so a client reacting to it finds the results.
+    ProcessingStatus.advance(style_image_id, ProcessingStatus.State.DONE)
+
+    if style_image.user_id is not None:
+        send_notification_task.delay(
+            user_id=style_image.user_id,
+            title="Results are ready!",
+            message=f"We found {product_count} products that fit your style.",
+            payload={"style_image": str(style_image)},
+        )
+
+    # The stages may run in different processes, so the total uses wall-clock time.
+    if started_at is not None:
+        metrics.observe('pipeline.total', time.time() - started_at)
+
+    return (f"Pipeline complete for StyleImage {style_image_id}: {len(segment_ids)} segments embedded, "
+            f"{product_count} products recommended.")
+
+
+def prepare_style_image(style_image):
+    """
+    Loads the uploaded StyleImage upright and capped to STYLE_IMAGE_MAX_SIDE.
+    When that changes the pixels, the stored file is replaced by the prepared
+    version so segments share the stored image's coordinates.
+    """
+    image, modified = load_capped_image(style_image.image_url.path, settings.STYLE_IMAGE_MAX_SIDE)
+    if modified:
+        old_name = style_image.image_url.name
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        new_name = f"{os.path.splitext(os.path.basename(old_name))[0]}.jpg"
+        style_image.image_url.save(new_name, ContentFile(buffer.getvalue()), save=True)
+        style_image.image_url.storage.delete(old_name)
+    return image
@@ -1,3 +1,180 @@
-from django.test import TestCase
+import importlib.util
+import shutil
+import subprocess
+import tempfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from celery.exceptions import Retry
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from products.tests import create_catalog, selected_vector_columns
+from PIL import Image
+
+from products.models import Category
+from fashionRecommendationSystem import locks
+from users.models import User
+from . import tasks
+from .ai_services import segment_cache, style_embedding
+from .ai_services.image_preprocessing import scale_box
+from .models import ImageSegment, ProcessingStatus, RecommendationLog, StyleEmbedding, StyleImage
+
+
+class RecommendationLogColumnTests(TestCase):
+    """The recommendation history loads its products without the vector columns."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', email='shopper@example.com', password='password123')
+        style_image = StyleImage.objects.create(user=cls.user, image_url='style_images/look.jpg')
+        cls.log = RecommendationLog.objects.create(user=cls.user, style_image=style_image)
+        cls.log.recommended_products.set(create_catalog(3))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_list_and_detail(self):
+        for url in ('/api/recommendation-logs/', f'/api/recommendation-logs/{self.log.pk}/'):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(selected_vector_columns(queries), set())
+
+        self.assertEqual(len(response.json()['data']['recommended_products']), 3)
+
+
+class FinalizeStyleImageTests(TestCase):
+    def test_nothing_embedded_fails_without_notifying(self):
+        user = User.objects.create_user(username='shopper', email='shopper@example.com', password='password123')
+        style_image = StyleImage.objects.create(user=user, image_url='style_images/look.jpg')
+        ProcessingStatus.objects.create(style_image=style_image, state=ProcessingStatus.State.EMBEDDING)
+
+        with mock.patch.object(tasks.send_notification_task, 'delay') as notify:
+            tasks.finalize_style_image([{'segment_ids': [], 'seconds': 0.1}], str(style_image.pk))
+
+        notify.assert_not_called()
+        status = ProcessingStatus.objects.get(style_image=style_image)
+        self.assertEqual(status.state, ProcessingStatus.State.FAILED)
+        self.assertIsNotNone(status.finished_at)
+
+
+class SegmentHandoffTests(TestCase):
+    """STYLE_SEGMENT_MEMORY_HANDOFF: segments are embedded from memory, but their PNGs exist first."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=media_root, STYLE_SEGMENT_MEMORY_HANDOFF=True, SEGMENTATION_DETECTOR_GATE=False
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        user = User.objects.create_user(username='shopper', email='shopper@example.com', password='password123')
+        self.style_image = StyleImage.objects.create(user=user, image_url='style_images/look.jpg')
+        ProcessingStatus.objects.create(style_image=self.style_image)
+        Category.objects.create(name='Dress')
+
+    def test_pngs_are_written_before_retrieval_is_queued(self):
+        segmenter = mock.Mock()
+        segmenter.run_segmentation.return_value = {'dress': Image.new('RGBA', (40, 80), (200, 0, 0, 255))}
+
+        def finalize(*args, **kwargs):
+            self.assertTrue(all(segment.image_url for segment in ImageSegment.objects.all()))
+
+        with mock.patch.object(tasks, 'prepare_style_image', return_value=Image.new('RGB', (100, 200))), \
+                mock.patch.object(tasks, 'get_segmenter', return_value=segmenter), \
+                mock.patch.object(tasks, 'process_style_embeddings',
+                                  side_effect=lambda ids, gender: {'segment_ids': ids, 'seconds': 0}), \
+                mock.patch.object(tasks.finalize_style_image, 'delay', side_effect=finalize) as queued:
+            tasks.process_style_image_segmentation(str(self.style_image.pk))
+
+        queued.assert_called_once()
+        self.assertEqual(ImageSegment.objects.count(), 1)
+
+    def test_a_failed_disk_run_keeps_the_vectors_from_memory(self):
+        category = Category.objects.get()
+        in_memory = ImageSegment.objects.create(style_image=self.style_image, category_type=category,
+                                                image_url='segments/a.png')
+        on_disk = ImageSegment.objects.create(style_image=self.style_image,
+                                              category_type=Category.objects.create(name='Top'),
+                                              image_url='segments/b.png')
+        segment_cache.put(in_memory.segmentId, tasks.to_style2vec_input(Image.new('RGB', (10, 10))))
+
+        with mock.patch.object(style_embedding, 'generate_style_embeddings_from_pixels', return_value=[[1.0]]), \
+                mock.patch.object(style_embedding, 'generate_style_embeddings',
+                                  side_effect=subprocess.CalledProcessError(1, 'style2vec')):
+            vectors = style_embedding._embed_segments([in_memory, on_disk])
+
+        self.assertEqual(vectors, [[1.0], None])
+
+
+class RedeliveryTests(TestCase):
+    """Segmentation and retrieval survive a crashed, redelivered (acks_late) task."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='shopper', email='shopper@example.com', password='password123')
+        self.style_image = StyleImage.objects.create(user=user, image_url='style_images/look.jpg')
+        self.status = ProcessingStatus.objects.create(style_image=self.style_image,
+                                                      state=ProcessingStatus.State.EMBEDDING)
+        self.segment = ImageSegment.objects.create(style_image=self.style_image,
+                                                   category_type=Category.objects.create(name='Dress'),
+                                                   image_url='segments/dress.png')
+
+    def embed_segment(self):
+        StyleEmbedding.objects.create(segment=self.segment, embeddings=[0.0] * 2048)
+
+    def test_segmentation_retries_while_the_lock_is_held(self):
+        lock = f'segmentation:{self.style_image.pk}'
+        self.assertTrue(locks.acquire(lock, 60))
+        self.addCleanup(locks.release, lock)
+        with self.assertRaises(Retry):
+            tasks.process_style_image_segmentation(str(self.style_image.pk))
+
+    def test_embedded_image_without_retrieval_gets_finalized(self):
+        self.embed_segment()
+        with mock.patch.object(tasks.finalize_style_image, 'delay') as finalize:
+            tasks.process_style_image_segmentation(str(self.style_image.pk))
+        finalize.assert_called_once()
+        self.assertEqual(finalize.call_args.args[0][0]['segment_ids'], [str(self.segment.pk)])
+
+        ProcessingStatus.advance(self.style_image.pk, ProcessingStatus.State.DONE)
+        with mock.patch.object(tasks.finalize_style_image, 'delay') as finalize:
+            tasks.process_style_image_segmentation(str(self.style_image.pk))
+        finalize.assert_not_called()
+
+    def test_finalize_runs_once(self):
+        ProcessingStatus.advance(self.style_image.pk, ProcessingStatus.State.DONE)
+        with mock.patch.object(tasks.send_notification_task, 'delay') as notify, \
+                mock.patch.object(tasks, 'get_recommendations_for_segments') as retrieve:
+            tasks.finalize_style_image([{'segment_ids': [str(self.segment.pk)], 'seconds': 1}],
+                                       str(self.style_image.pk))
+        retrieve.assert_not_called()
+        notify.assert_not_called()
+
+
+@skipUnless(importlib.util.find_spec('ultralytics') and importlib.util.find_spec('clip'), 'FastSAM and CLIP not installed')
+class FastSAMMaskAssignmentTests(TestCase):
+    def test_each_mask_goes_to_one_category_above_the_threshold(self):
+        from .ai_services.fast_sam_segmenter import assign_masks
+
+        similarity = [
+            [0.25, 0.30],  # top: its best mask
+            [0.29, 0.10],  # pants: mask 0, not taken by top
+            [0.28, 0.12],  # dress: mask 0 is taken, mask 1 is too far off
+        ]
+        self.assertEqual(assign_masks(similarity, min_similarity=0.2), {0: 1, 1: 0})
+        self.assertEqual(assign_masks([[0.1, 0.15]], min_similarity=0.2), {})
+
+
+class ScaleBoxTests(SimpleTestCase):
+    def test_scales_to_the_nearest_pixel(self):
+        self.assertEqual(scale_box((2, 4, 10, 12), (128, 128), (512, 256)), (8, 8, 40, 24))
+
+    def test_keeps_one_pixel_on_images_smaller_than_the_grid(self):
+        # One logit cell of a 128x128 grid on a 40x30 image.
+        for cell in ((0, 0, 1, 1), (63, 63, 64, 64), (127, 127, 128, 128)):
+            left, top, right, bottom = scale_box(cell, (128, 128), (40, 30))
+            self.assertTrue(0 <= left < right <= 40 and 0 <= top < bottom <= 30, (cell, (left, top, right, bottom)))
@@ -1,10 +1,17 @@
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from .models import StyleImage, RecommendationLog, Feedback
+from .models import StyleImage, RecommendationLog, Feedback, ProcessingStatus
 from .serializers import StyleImageSerializer, FeedbackSerializer, \
-    RecommendationLogListSerializer, RecommendationLogDetailSerializer
+    RecommendationLogListSerializer, RecommendationLogDetailSerializer, ProcessingStatusSerializer
 from rest_framework.parsers import MultiPartParser, FormParser
 from .tasks import process_style_image_segmentation  # <--- IMPORT THE TASK
+from .load_shedding import should_shed, popular_products
+from fashionRecommendationSystem import metrics
+from fashionRecommendationSystem.pagination import KeysetPagination
+from fashionRecommendationSystem.throttling import UploadCostThrottle
+from products.serializers import ProductMiniSerializer
 
 
 class StyleImageViewSet(viewsets.ModelViewSet):
@@ -16,13 +23,34 @@ class StyleImageViewSet(viewsets.ModelViewSet):
     serializer_class = StyleImageSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
+    # Uploads are charged by their pipeline cost (see fashionRecommendationSystem/throttling.py).
+    throttle_classes = [UploadCostThrottle]
 
     def get_queryset(self):
         return StyleImage.objects.filter(user=self.request.user)
 
+    def create(self, request, *args, **kwargs):
+        # Check the backlog before queuing this upload (see load_shedding.py).
+        shed, wait = should_shed()
+        response = super().create(request, *args, **kwargs)
+        response.data['is_degraded'] = shed
+        response.data['estimated_wait_seconds'] = round(wait) if wait is not None else None
+        if shed:
+            metrics.incr('uploads.degraded')
+            products = popular_products(request.user, request.data.get('gender'))
+            response.data['recommendations'] = ProductMiniSerializer(
+                products, many=True, context=self.get_serializer_context()
+            ).data
+            response._success_message = (
+                "We're busy right now, so here are popular picks for you. "
+                "Your personalised results will follow shortly."
+            )
+        return response
+
     def perform_create(self, serializer):
         # First, save the StyleImage instance to the database
         style_image = serializer.save(user=self.request.user)
+        ProcessingStatus.objects.create(style_image=style_image)
 
         # --- TRIGGER THE BACKGROUND TASK ---
         # We pass the ID of the object, not the object itself, as it's better for serialization.
@@ -32,13 +60,29 @@ class StyleImageViewSet(viewsets.ModelViewSet):
         # The view's job is done. It returns immediately to the user.
         # The Celery worker will handle the rest.
 
+    @action(detail=True, methods=['get'], url_path='status')
+    def processing_status(self, request, pk=None):
+        """
+        Where the style image is in the pipeline, with per-stage timings.
+        Reads the single status row only, so clients can poll it.
+        """
+        processing_status = get_object_or_404(
+            ProcessingStatus, style_image_id=pk, style_image__user=request.user
+        )
+        return Response(ProcessingStatusSerializer(processing_status).data)
+
 
 class RecommendationLogViewSet(viewsets.ReadOnlyModelViewSet):
     """View a history of your recommendations."""
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return RecommendationLog.objects.filter(user=self.request.user)
+        queryset = RecommendationLog.objects.filter(user=self.request.user)
+        if self.action == 'retrieve':
+            # Related products come from Product's default manager, without vector columns
+            queryset = queryset.prefetch_related('recommended_products__images')
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'list':